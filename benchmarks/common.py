@@ -0,0 +1,27 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+import os, sys, time, argparse
+from contextlib import contextmanager
+
+
+def argument_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--pynta", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pynta"),
+                        help="the folder containing the pynta modules to be benchmarked")
+    return parser
+
+
+def use_pynta(path):
+    # the modules of pynta import each other as top-level modules
+    sys.path.insert(0, os.path.abspath(path))
+
+
+@contextmanager
+def timed(label):
+    start = time.perf_counter()
+    yield
+    print(f"{label}: {time.perf_counter() - start:.2f} s")
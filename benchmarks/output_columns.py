@@ -0,0 +1,60 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+
+Time the validation of the columns of an output file with the python and the numpy engines, either on lines made of
+10 float columns (wide) or of an int and a float column (narrow)
+'''
+
+import os, time, random, tempfile
+
+from common import argument_parser, use_pynta, timed
+
+
+# the columns of each workload and a function that generates the values of a line
+WORKLOADS = {
+    # many floats per line, where numpy pays off the most
+    "wide" : ([{"datatype" : "float"}] * 10,
+              lambda rng: " ".join(f"{rng.uniform(-1000, 1000):.3f}" for _ in range(10))),
+    "narrow" : ([{"datatype" : "int", "max_length" : 10}, {"datatype" : "float", "decimal_positions" : 2, "max_length" : 10}],
+                lambda rng: f"{rng.randint(-10**8, 10**8)} {rng.uniform(-1000, 1000):.2f}")
+}
+
+
+def generate(path, lines, line):
+    rng = random.Random(42)
+    # formatting random numbers is slow, and the file is made of lines drawn from a smaller set
+    pool = [line(rng) for _ in range(min(lines, 10000))]
+    with open(path, "w") as f:
+        for _ in range(lines):
+            print(rng.choice(pool), file=f)
+
+
+if __name__ == '__main__':
+    parser = argument_parser("Time the validation of the columns of a large output file")
+    parser.add_argument("--workload", choices=list(WORKLOADS), default="wide", 
+                        help="either 10 float columns per line (wide, the default) or an int and a float column (narrow)")
+    parser.add_argument("--lines", type=int, default=1000000, help="the number of lines of the file")
+    parser.add_argument("--engine", action="append", choices=["python", "numpy"], 
+                        help="the engine(s) to be used (default: both)")
+    args = parser.parse_args()
+    use_pynta(args.pynta)
+    from output import Output
+
+    columns, line = WORKLOADS[args.workload]
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        with timed(f"generating {args.lines} lines ({args.workload} workload)"):
+            generate("output.dat", args.lines, line)
+            
+        results = []
+        for engine in args.engine or ["python", "numpy"]:
+            output = Output({"type" : "file", "name" : "output.dat", "columns" : columns, "engine" : engine})
+            start = time.perf_counter()
+            output.check()
+            results.append((engine, time.perf_counter() - start, output.num_errors))
+            
+        print(f"{'engine':<8} {'time (s)':>10} {'errors':>8}")
+        for engine, elapsed, num_errors in results:
+            print(f"{engine:<8} {elapsed:>10.2f} {num_errors:>8}")
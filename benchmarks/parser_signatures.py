@@ -0,0 +1,56 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+
+Time the extraction of the function signatures from some generated sources
+'''
+
+import os, tempfile
+
+from common import argument_parser, use_pynta, timed
+
+
+def many_functions(n):
+    return "".join(f"/* function {i} */\nstatic double *function_{i}(int a, const char *b, double c[]) {{\n\tif(a > 0) {{ return c; }}\n\treturn NULL; // nothing\n}}\n\n" for i in range(n))
+
+
+def lookup_table(n):
+    return "const int table[] = {\n" + ",\n".join(f"\t{i}, {i * i}, {i % 7}" for i in range(n)) + "\n};\n\nint main() {\n\treturn 0;\n}\n"
+
+
+def identifiers(n):
+    # a long run of identifiers followed by a semicolon, on which the regex pipeline of older versions takes quadratic time
+    return " ".join(f"identifier_{i}" for i in range(n)) + ";\n"
+
+
+SOURCES = {
+    "functions" : many_functions,
+    "table" : lookup_table,
+    "identifiers" : identifiers
+}
+
+DEFAULT_SIZES = {
+    "functions" : 40000,
+    "table" : 1000000,
+    "identifiers" : 2000
+}
+
+
+if __name__ == '__main__':
+    parser = argument_parser("Time the extraction of the function signatures from some generated sources")
+    for name, size in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{name}", type=int, default=size, help=f"the size of the '{name}' source (default: {size})")
+    args = parser.parse_args()
+    use_pynta(args.pynta)
+    from parser import Parser
+    
+    with tempfile.TemporaryDirectory() as folder:
+        for name, generate in SOURCES.items():
+            path = os.path.join(folder, f"{name}.c")
+            with open(path, "w") as f:
+                f.write(generate(getattr(args, name)))
+            
+            options = {"filename" : path, "parsing" : {"functions" : [{"name" : "main", "return_type" : "int", "arg_types" : []}]}}
+            with timed(f"{name} ({os.path.getsize(path) / 1024 / 1024:.2f} MB)"):
+                Parser(options)
@@ -0,0 +1,74 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+
+Measure the time and the memory required to parse a large valgrind log
+'''
+
+import os, random, tempfile, tracemalloc
+
+from common import argument_parser, use_pynta, timed
+
+ERROR = '''<error>
+  <unique>0x{unique:x}</unique>
+  <tid>1</tid>
+  <kind>{kind}</kind>
+  <what>{what}</what>
+  <stack>
+{frames}  </stack>
+</error>
+'''
+
+FRAME = '''    <frame>
+      <ip>0x{ip:X}</ip>
+      <obj>/home/student/submission/mycode</obj>
+      <fn>function_{function}</fn>
+      <dir>/home/student/submission</dir>
+      <file>mycode.c</file>
+      <line>{line}</line>
+    </frame>
+'''
+
+KINDS = [("InvalidRead", "Invalid read of size 4"), ("InvalidWrite", "Invalid write of size 8"), 
+         ("UninitCondition", "Conditional jump or move depends on uninitialised value(s)")]
+
+
+def generate(path, errors, min_frames, max_frames):
+    rng = random.Random(42)
+    with open(path, "w") as f:
+        print('<?xml version="1.0"?>\n<valgrindoutput>\n<protocolversion>4</protocolversion>', file=f)
+        for unique in range(errors):
+            kind, what = rng.choice(KINDS)
+            frames = "".join(FRAME.format(ip=rng.getrandbits(32), function=rng.randrange(100), line=rng.randrange(1, 1000)) 
+                             for _ in range(rng.randint(min_frames, max_frames)))
+            f.write(ERROR.format(unique=unique, kind=kind, what=what, frames=frames))
+        print('</valgrindoutput>', file=f)
+
+
+if __name__ == '__main__':
+    parser = argument_parser("Measure the time and the memory required to parse a large valgrind log")
+    parser.add_argument("--errors", type=int, default=30000, help="the number of errors in the log")
+    parser.add_argument("--min-frames", type=int, default=2, help="the minimum number of frames of each error")
+    parser.add_argument("--max-frames", type=int, default=12, help="the maximum number of frames of each error")
+    parser.add_argument("--max-errors", type=int, default=0, help="the maximum number of errors that are stored (0 means no limit)")
+    args = parser.parse_args()
+    use_pynta(args.pynta)
+    from launcher import ValgrindData
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "valgrind_log.xml")
+        generate(path, args.errors, args.min_frames, args.max_frames)
+        print(f"log size: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+        
+        # older versions do not support max_errors
+        limit = [False, args.max_errors] if args.max_errors > 0 else []
+        with timed("parsing"):
+            ValgrindData().parse(path, *limit)
+        
+        tracemalloc.start()
+        data = ValgrindData()
+        data.parse(path, *limit)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"retained memory: {retained / 1024 / 1024:.1f} MB, peak: {peak / 1024 / 1024:.1f} MB ({len(data.errors)} errors)")
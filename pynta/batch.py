@@ -0,0 +1,272 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+from dataclasses import dataclass, field
+from multiprocessing import Pool
+from typing import List, Optional
+import sys, os, copy, glob, json
+
+from pynta import Input, Analyser
+from utils import print_log_section
+from reference import cache as reference_cache
+from profiler import profiler
+from similarity import Similarity
+
+
+class BatchInput(Input):
+    '''
+    The same configuration used to grade a single submission, with the difference that
+    the source file is not specified in the input file but rather provided by the batch
+    '''
+    required = []
+
+
+@dataclass
+class SubmissionResult:
+    '''
+    The (picklable) outcome of the analysis of a single submission
+    '''
+    name: str
+    filename: str
+    summaries: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    parsed: Optional[bool] = None
+    compiled: Optional[bool] = None
+    executed: Optional[bool] = None
+    memory_clean: Optional[bool] = None
+    outputs_ok: Optional[bool] = None
+    # the structured report of the analysis, only built if report_format is "json"
+    report: Optional[dict] = None
+    # the events collected by the profiler, in the Trace Event Format, if profiling is enabled
+    events: List[dict] = field(default_factory=list)
+
+    def status(self):
+        if self.error is not None:
+            return "ERROR"
+        if self.compiled and self.executed and self.memory_clean is not False and self.outputs_ok:
+            return "OK"
+        return "FAILED"
+
+
+def find_submissions(paths):
+    '''
+    Expand each path to a list of source files: directories are searched for .c files,
+    glob patterns are expanded, and everything else is taken as is
+    '''
+    submissions = []
+    for path in paths:
+        if os.path.isdir(path):
+            submissions += sorted(glob.glob(os.path.join(path, "*.c")))
+        elif glob.has_magic(path):
+            submissions += sorted(glob.glob(path))
+        else:
+            submissions.append(path)
+
+    return [os.path.abspath(s) for s in submissions]
+
+
+def _submission_options(template, filename, name):
+    options = copy.deepcopy(template)
+    options["filename"] = filename
+    options["working_dir"] = os.path.join(template["working_dir"], name)
+
+    # reference files are specified relative to the working dir, which changes for each submission
+    for output in options.outputs():
+        if "equal_to" in output:
+            output["equal_to"] = os.path.join(template["working_dir"], output["equal_to"])
+
+    return options
+
+
+def load_references(options):
+    '''
+    Load the reference files of the outputs in the cache, so that processes forked afterwards all share the same copy
+    '''
+    reference_cache.enabled = True
+    for output in options.outputs():
+        if "equal_to" not in output:
+            continue
+        path = os.path.join(options["working_dir"], output["equal_to"])
+        if os.path.isfile(path):
+            reference = reference_cache.get(path)
+            if "abs_tolerance" in output or "rel_tolerance" in output:
+                reference.parse()
+
+
+def grade(options, out=None):
+    result = SubmissionResult(os.path.basename(options["working_dir"]), options["filename"])
+
+    cwd = os.getcwd()
+    os.makedirs(options["working_dir"], exist_ok=True)
+    os.chdir(options["working_dir"])
+
+    analyser = Analyser(options)
+    try:
+        analyser.run(out)
+    # Input-related errors call exit(), which would otherwise take the worker down
+    except (Exception, SystemExit) as e:
+        result.error = str(e)
+    finally:
+        os.chdir(cwd)
+
+    result.summaries = analyser.summaries
+    if analyser.parser is not None:
+        result.parsed = len(analyser.parser.errors) == 0
+    if analyser.compiler is not None:
+        result.compiled = analyser.compiler.compiled()
+    if analyser.launcher is not None:
+        result.executed = analyser.launcher.success()
+        if analyser.launcher.valgrind_enabled:
+            result.memory_clean = analyser.launcher.valgrind_num_errors() == 0
+    if analyser.check_output is not None:
+        result.outputs_ok = not any(output.has_errors() for output in analyser.check_output.outputs)
+    if analyser.cases is not None:
+        result.executed = analyser.cases.success()
+        if options["valgrind"]["enable"]:
+            result.memory_clean = analyser.cases.memory_clean()
+        result.outputs_ok = analyser.cases.outputs_ok()
+    if options["report_format"] == "json":
+        result.report = analyser.to_dict()
+        result.report["error"] = result.error
+    if options["profiling"]["enable"]:
+        result.events = [event.to_chrome() for event in analyser.events]
+
+    return result
+
+
+class Batch:
+
+    def __init__(self, options, submissions):
+        self.options = options
+        self.options["working_dir"] = os.path.abspath(self.options["working_dir"])
+        self.results = []
+        self.similarity = None
+
+        self.jobs = []
+        names = set()
+        for filename in submissions:
+            name = os.path.splitext(os.path.basename(filename))[0]
+            # submissions coming from different folders may share the same name
+            unique_name, i = name, 1
+            while unique_name in names:
+                i += 1
+                unique_name = f"{name}_{i}"
+            names.add(unique_name)
+
+            self.jobs.append(_submission_options(self.options, filename, unique_name))
+
+    def run(self, out=None):
+        processes = self.options["batch"]["processes"]
+        if processes <= 0:
+            processes = os.cpu_count()
+            
+        if self.options["batch"]["cache_references"]:
+            # the references are loaded before the worker processes are forked
+            load_references(self.options)
+
+        with Pool(processes) as pool:
+            for result in pool.imap_unordered(grade, self.jobs):
+                self.results.append(result)
+                if out is not None:
+                    print(f"[{len(self.results)}/{len(self.jobs)}] {result.name}: {result.status()}", file=out)
+
+        self.results.sort(key=lambda r: r.name)
+
+        if self.options["similarity"]["enable"]:
+            if self.options["profiling"]["enable"]:
+                # the workers have collected their own events, these are the ones of the similarity search
+                profiler.enabled = True
+                profiler.reset()
+            submissions = [(os.path.basename(job["working_dir"]), job["filename"]) for job in self.jobs]
+            self.similarity = Similarity(self.options, submissions, processes)
+
+    def _count(self, attribute):
+        return sum(1 for r in self.results if getattr(r, attribute))
+
+    def summary(self):
+        N = len(self.results)
+        lines = [
+            f"Submissions: {N}",
+            f"\tParsing OK: {self._count('parsed')}/{N}",
+            f"\tCompilation OK: {self._count('compiled')}/{N}",
+            f"\tExecution OK: {self._count('executed')}/{N}",
+        ]
+        if self.options["valgrind"]["enable"]:
+            name = "Sanitizers" if self.options["valgrind"]["backend"] == "sanitizer" else "Valgrind"
+            lines.append(f"\t{name} OK: {self._count('memory_clean')}/{N}")
+        lines.append(f"\tOutputs OK: {self._count('outputs_ok')}/{N}")
+
+        N_errors = sum(1 for r in self.results if r.error is not None)
+        if N_errors > 0:
+            lines.append(f"\tAnalysis errors: {N_errors}/{N}")
+            
+        if self.similarity is not None:
+            lines.append(f"\t{self.similarity.summary()}")
+
+        return "\n".join(lines)
+
+    def write_report(self):
+        profiling = self.options["profiling"]
+        if profiling["enable"] and profiling["trace_file"] != "":
+            # each worker has its own pid, and therefore its own track in the trace
+            events = [event for result in self.results for event in result.events]
+            events += [event.to_chrome() for event in profiler.events]
+            profiler.write_chrome_trace(os.path.join(self.options["working_dir"], profiling["trace_file"]), events)
+            
+        if self.similarity is not None:
+            if self.options["report_format"] == "json":
+                self.similarity.write_json_report()
+            else:
+                self.similarity.write_report()
+            
+        if self.options["report_format"] == "json":
+            self.write_json_report()
+            return
+        
+        with open(os.path.join(self.options["working_dir"], self.options["batch"]["report_path"]), "w") as f:
+            print(self.summary(), file=f)
+            print("", file=f)
+
+            for result in self.results:
+                print_log_section(f"{result.name}: {result.status()}", f)
+                print(f"Source file: {result.filename}", file=f)
+                for summary in result.summaries:
+                    print(summary, file=f)
+                if result.error is not None:
+                    print(f"ERROR: {result.error}", file=f)
+
+    def write_json_report(self):
+        '''
+        Write one JSON document per line (NDJSON), each containing the report of a single submission
+        '''
+        lines = []
+        for result in self.results:
+            report = {"name" : result.name, "status" : result.status()}
+            report.update(result.report)
+            lines.append(json.dumps(report) + "\n")
+            
+        with open(os.path.join(self.options["working_dir"], self.options["batch"]["json_report_path"]), "w") as f:
+            f.write("".join(lines))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(f"Usage is {sys.argv[0]} input_file submission [submission ...]")
+        print("\twhere each submission can be a source file, a folder containing source files or a (quoted) glob pattern")
+        exit(1)
+
+    options = BatchInput(sys.argv[1])
+    submissions = find_submissions(sys.argv[2:])
+    if len(submissions) == 0:
+        print("No submissions found", file=sys.stderr)
+        exit(1)
+
+    os.makedirs(options["working_dir"], exist_ok=True)
+
+    batch = Batch(options, submissions)
+    batch.run(sys.stdout)
+    batch.write_report()
+    print(batch.summary())
@@ -0,0 +1,127 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import os, copy
+
+from launcher import Launcher
+from output import CheckOutput
+from profiler import profiler
+
+
+def case_options(options, case):
+    '''
+    The options of a single case: the values it sets override the ones of the [execution] section, and its outputs
+    (if any) replace the top-level ones
+    '''
+    options = copy.copy(options)
+    execution = {key : value for key, value in options["execution"].items() if key != "cases"}
+    execution.update({key : value for key, value in case.items() if key not in ["name", "output"]})
+    options["execution"] = execution
+    if "output" in case:
+        options["output"] = case["output"]
+    return options
+
+
+class Case:
+    '''
+    A single run of the executable, carried out in its own folder, and the checks of its outputs
+    '''
+
+    def __init__(self, options, name, folder):
+        self.options = options
+        self.name = name
+        self.folder = folder
+        self.launcher = None
+        self.check_output = None
+
+    def run(self, exe_file, sanitized_exe_file=None):
+        os.makedirs(self.folder, exist_ok=True)
+        with profiler.span(f"case {self.name}", "execution"):
+            self.launcher = Launcher(self.options, exe_file, sanitized_exe_file, self.folder)
+            self.check()
+
+    def check(self):
+        self.check_output = CheckOutput(self.options, self.launcher.stdout, self.launcher.stderr, self.folder)
+
+    def memory_clean(self):
+        return not self.launcher.valgrind_enabled or self.launcher.valgrind_num_errors() == 0
+
+    def outputs_ok(self):
+        return not any(output.has_errors() for output in self.check_output.outputs)
+
+    def summary(self):
+        lines = [f"Case {self.name}:"]
+        for line in [self.launcher.summary(), self.check_output.summary()]:
+            lines += ["\t" + l for l in line.split("\n")]
+        return "\n".join(lines)
+
+    def write_report(self):
+        self.launcher.write_report()
+        self.check_output.write_report()
+
+    def to_dict(self):
+        return {
+            "name" : self.name,
+            "folder" : self.folder,
+            "execution" : self.launcher.to_dict(),
+            "output" : self.check_output.to_dict()
+        }
+
+
+class Cases:
+    '''
+    Runs all the [[execution.cases]] in parallel against the same executable. Each case is run in the case_NAME folder,
+    where its output files and reports are written
+    '''
+
+    def __init__(self, options, exe_file, sanitized_exe_file=None):
+        self.options = options
+        self.cases = []
+        for i, case in enumerate(options["execution"]["cases"], 1):
+            name = str(case.get("name", i))
+            self.cases.append(Case(case_options(options, case), name, os.path.abspath(f"case_{name}")))
+
+        max_workers = options["execution"]["max_parallel_cases"]
+        if max_workers <= 0:
+            max_workers = os.cpu_count()
+        with ThreadPoolExecutor(max_workers) as pool:
+            # consume the results so that exceptions raised by the cases are propagated
+            list(pool.map(lambda case: case.run(exe_file, sanitized_exe_file), self.cases))
+
+    def check(self, options):
+        '''
+        Check the outputs of the cases again, according to the (possibly updated) options
+        '''
+        self.options = options
+        for case, case_config in zip(self.cases, options["execution"]["cases"]):
+            case.options = case_options(options, case_config)
+            case.check()
+
+    def artifacts(self):
+        return [path for case in self.cases for path in case.launcher.artifacts()]
+
+    def success(self):
+        return all(case.launcher.success() for case in self.cases)
+
+    def memory_clean(self):
+        return all(case.memory_clean() for case in self.cases)
+
+    def outputs_ok(self):
+        return all(case.outputs_ok() for case in self.cases)
+
+    def summary(self):
+        N_ok = sum(1 for case in self.cases if case.launcher.success() and case.memory_clean() and case.outputs_ok())
+        lines = [f"Cases: {N_ok}/{len(self.cases)} OK"]
+        lines += [case.summary() for case in self.cases]
+        return "\n".join(lines)
+
+    def write_report(self):
+        for case in self.cases:
+            case.write_report()
+
+    def to_dict(self):
+        return {"cases" : [case.to_dict() for case in self.cases]}
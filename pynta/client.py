@@ -0,0 +1,83 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+import sys, os, json, socket, argparse
+
+
+def request(socket_path, message):
+    '''
+    Send a request to the daemon and yield its replies
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        s.sendall((json.dumps(message) + "\n").encode())
+        with s.makefile("r") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def submit(args):
+    message = {"command" : "grade", "config" : os.path.abspath(args.config), "filename" : os.path.abspath(args.submission),
+               "cwd" : os.getcwd(), "priority" : args.priority}
+    status = 1
+    for reply in request(args.socket, message):
+        if reply["event"] == "queued":
+            print(f"Job {reply['job']} queued, results will be written to {reply['working_dir']}", file=sys.stderr)
+        elif reply["event"] == "progress":
+            print(reply["summary"])
+        elif reply["event"] == "result":
+            if reply["error"] is not None:
+                print(f"ERROR: {reply['error']}", file=sys.stderr)
+            print(f"Status: {reply['status']}")
+            status = 0
+        elif reply["event"] == "cancelled":
+            print(f"Job {reply['job']} has been cancelled", file=sys.stderr)
+        elif reply["event"] == "error":
+            print(f"ERROR: {reply['message']}", file=sys.stderr)
+    return status
+
+
+def cancel(args):
+    for reply in request(args.socket, {"command" : "cancel", "job" : args.job}):
+        if reply["event"] == "error":
+            print(f"ERROR: {reply['message']}", file=sys.stderr)
+            return 1
+        if not reply["ok"]:
+            print(f"Job {args.job} is not queued or running", file=sys.stderr)
+            return 1
+    return 0
+
+
+def status(args):
+    for reply in request(args.socket, {"command" : "status"}):
+        for job in reply["jobs"]:
+            print(f"{job['job']}\t{job['state']}\tpriority {job['priority']}\t{job['filename']}")
+    return 0
+
+
+if __name__ == '__main__':
+    # this script only talks to daemon.py, and therefore it does not import any of the (slow to load) grading modules
+    parser = argparse.ArgumentParser(description="Send jobs to a running daemon.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    grade_parser = commands.add_parser("grade", help="grade a submission and print the results as they come")
+    grade_parser.add_argument("socket", help="path of the UNIX socket the daemon listens on")
+    grade_parser.add_argument("config", help="input file")
+    grade_parser.add_argument("submission", help="source file")
+    grade_parser.add_argument("--priority", type=int, default=0, help="jobs with higher priority are graded first")
+    grade_parser.set_defaults(function=submit)
+
+    cancel_parser = commands.add_parser("cancel", help="cancel a queued or running job")
+    cancel_parser.add_argument("socket")
+    cancel_parser.add_argument("job", type=int)
+    cancel_parser.set_defaults(function=cancel)
+
+    status_parser = commands.add_parser("status", help="list the queued and running jobs")
+    status_parser.add_argument("socket")
+    status_parser.set_defaults(function=status)
+
+    args = parser.parse_args()
+    exit(args.function(args))
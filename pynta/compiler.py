@@ -4,11 +4,15 @@ Created on Dec 27, 2022
 @author: lorenzo
 '''
 
-from dataclasses import dataclass
-import os, re
+from dataclasses import dataclass, asdict, field
+from functools import lru_cache
+from typing import List, Optional
+import os, re, json, shutil, hashlib, tempfile
 import subprocess as sp
 
 from utils import print_log_section
+from runner import run_and_capture
+from profiler import profiler
 
 
 @dataclass
@@ -20,23 +24,268 @@ class Entry:
     file: str
     severity: str
     message: str
-    lineno: int = None
-    column: int = None
+    lineno: Optional[int] = None
+    column: Optional[int] = None
+    # the option that controls the warning (e.g. -Wunused-variable), if any
+    option: Optional[str] = None
+    # the changes suggested by the compiler, each stored as a dictionary with line, column, next_column and string keys
+    fixits: List[dict] = field(default_factory=list)
     
     def __str__(self):
         severity = self.severity.upper()
         if self.column is not None:
-            return f"{severity}: line {self.lineno}, column {self.column}: {self.message}"
+            s = f"{severity}: line {self.lineno}, column {self.column}: {self.message}"
         elif self.lineno is not None:
-            return f"{severity}: line {self.lineno}: {self.message}"
+            s = f"{severity}: line {self.lineno}: {self.message}"
         else:
-            return f"{severity}: {self.message}"
+            s = f"{severity}: {self.message}"
+        for fixit in self.fixits:
+            s += f"\n\tsuggested fix: line {fixit['line']}, column {fixit['column']}: '{fixit['string']}'"
+        return s
+
+
+@lru_cache(maxsize=None)
+def compiler_version(executable):
+    try:
+        result = sp.run([executable, "--version"], stdout=sp.PIPE, stderr=sp.STDOUT, text=True)
+    except OSError:
+        return None
+    return result.stdout
+
+
+def supports_aux_info(executable):
+    '''
+    -aux-info is a gcc-only option (clang, which also goes by the name of gcc on some systems, rejects it)
+    '''
+    version = compiler_version(executable)
+    return version is not None and "clang" not in version.lower()
+
+
+@lru_cache(maxsize=None)
+def supports_json_diagnostics(executable):
+    '''
+    gcc supports -fdiagnostics-format=json since version 9, while clang does not support it at all
+    '''
+    try:
+        result = sp.run([executable, "-fdiagnostics-format=json", "-E", "-x", "c", os.devnull], stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    except OSError:
+        return False
+    return result.returncode == 0
+
+
+RE_WARNING_STATE = re.compile('^\\s+(-W[^\\s<]+)(?:<[^>]*>)?\\s+(\\S*)\\s*$')
+
+@lru_cache(maxsize=None)
+def enabled_warnings(command):
+    '''
+    Ask the compiler which warnings are enabled by the flags in command. Returns a dictionary mapping each
+    warning option to True (enabled), False (disabled) or None (unknown, e.g. enabled by default in some
+    language modes only), or None if the compiler does not support this kind of query (e.g. clang)
+    '''
+    try:
+        result = sp.run(command.split() + ["-Q", "--help=warning"], stdout=sp.PIPE, stderr=sp.STDOUT, text=True)
+    except OSError:
+        return None
+    if result.returncode != 0 or "unrecognized" in result.stdout:
+        return None
+    
+    warnings = {}
+    for line in result.stdout.splitlines():
+        m = RE_WARNING_STATE.match(line)
+        if m:
+            state = m.group(2)
+            if state == "[enabled]":
+                warnings[m.group(1)] = True
+            elif state == "[disabled]":
+                warnings[m.group(1)] = False
+            elif state.isdigit():
+                warnings[m.group(1)] = int(state) > 0
+            else:
+                warnings[m.group(1)] = None
+                
+    if len(warnings) == 0:
+        return None
+    return warnings
+
+
+def _promotes_warnings(argument):
+    return argument.startswith("-Werror") or argument == "-pedantic-errors"
+
+
+def _non_warning_arguments(command):
+    '''
+    The arguments of command that do not just select warnings
+    '''
+    def selects_warnings(argument):
+        return not _promotes_warnings(argument) and (argument.startswith("-W") or argument in ("-w", "-pedantic"))
+    
+    return [argument for argument in command.split() if not selects_warnings(argument)]
+
+
+def single_invocation_possible(command, all_warnings_command):
+    '''
+    A single compilation with all_warnings_command can stand in for both only if the two commands differ by the 
+    warnings they enable. Moreover, if warnings are turned into errors, the extra warnings would make it fail
+    '''
+    if any(_promotes_warnings(argument) for argument in (command + " " + all_warnings_command).split()):
+        return False
+    return _non_warning_arguments(command) == _non_warning_arguments(all_warnings_command)
+
+
+def _emits_debug_info(command):
+    return any(argument.startswith("-g") and argument != "-g0" for argument in command.split())
+
+
+class CompilationCache:
+    '''
+    On-disk, content-addressed cache of compilation results. Each entry is a folder whose name is the
+    hash of everything that can affect the compilation (source, commands and compiler version) and 
+    contains the executable (if any) and a json file with the compiler output and the parsed entries.
+    Entries are evicted in LRU order as soon as the total size of the cache exceeds the allowed size
+    '''
+    RESULT_FILE = "result.json"
+    EXE_FILE = "exe"
+    SANITIZED_EXE_FILE = "exe_sanitized"
+    
+    def __init__(self, options):
+        self.options = options
+        self.folder = os.path.expanduser(options["compilation"]["cache_dir"])
+        self.max_size = options["compilation"]["cache_max_size"] * 1024 * 1024
+        
+    def key(self, compiler):
+        h = hashlib.sha256()
+        with open(compiler.source_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        
+        compilation = self.options["compilation"]
+        parts = [compiler.command, compiler.command_post, str(self.options["valgrind"]["enable"])]
+        if compilation["all_warnings"]:
+            parts.append(compiler.all_warnings_command)
+            parts.append(str(compilation["single_invocation"]))
+        parts.append(str(compiler.json_diagnostics))
+        if compiler.sanitizer_enabled:
+            parts.append(compiler.sanitized_command)
+        if compiler.aux_info_enabled:
+            parts.append("aux-info")
+        parts.append(compiler_version(compiler.command.split()[0]) or "")
+        # the debug info embeds the path of the source and the folder it has been compiled in, which show up in
+        # the valgrind and sanitizer reports
+        commands = [compiler.command, compiler.command_post]
+        if compiler.sanitizer_enabled:
+            commands.append(compiler.sanitized_command)
+        if any(_emits_debug_info(command) for command in commands):
+            parts.append(os.path.abspath(compiler.source_file))
+            parts.append(os.getcwd())
+        for part in parts:
+            h.update(b"\0")
+            h.update(part.encode())
+            
+        return h.hexdigest()
+    
+    def _entry_folder(self, key):
+        return os.path.join(self.folder, key[0:2], key)
+        
+    def load(self, compiler):
+        folder = self._entry_folder(self.key(compiler))
+        result_file = os.path.join(folder, CompilationCache.RESULT_FILE)
+        try:
+            with open(result_file) as f:
+                result = json.load(f)
+            if result["regular_return_code"] == 0:
+                shutil.copy2(os.path.join(folder, CompilationCache.EXE_FILE), compiler.exe_file)
+            if result.get("sanitized_return_code") == 0:
+                shutil.copy2(os.path.join(folder, CompilationCache.SANITIZED_EXE_FILE), compiler.sanitized_exe_file)
+            os.utime(result_file)
+        except (OSError, ValueError):
+            return False
+        
+        # the cached entry may have been generated by an identical source file stored somewhere else
+        def fix_path(text):
+            return text.replace(result["source_file"], compiler.source_file)
+        
+        compiler.regular_return_code = result["regular_return_code"]
+        compiler.regular_output = fix_path(result["regular_output"])
+        if "all_warnings_output" in result:
+            compiler.all_warnings_return_code = result["all_warnings_return_code"]
+            compiler.all_warnings_output = fix_path(result["all_warnings_output"])
+        # -aux-info tags each prototype with the path of its file, which the parser matches against the source
+        compiler.aux_info = result.get("aux_info")
+        if compiler.aux_info is not None:
+            compiler.aux_info = fix_path(compiler.aux_info)
+        if "sanitized_return_code" in result:
+            compiler.sanitized_return_code = result["sanitized_return_code"]
+            compiler.sanitized_output = fix_path(result["sanitized_output"])
+        for name in ["warnings", "all_warnings", "errors"]:
+            entries = [Entry(**entry) for entry in result[name]]
+            for entry in entries:
+                entry.file = fix_path(entry.file)
+            setattr(compiler, name, entries)
+        
+        return True
+    
+    def store(self, compiler):
+        result = {
+            "source_file" : compiler.source_file,
+            "regular_return_code" : compiler.regular_return_code,
+            "regular_output" : compiler.regular_output,
+            "warnings" : [asdict(e) for e in compiler.warnings],
+            "all_warnings" : [asdict(e) for e in compiler.all_warnings],
+            "errors" : [asdict(e) for e in compiler.errors],
+            "aux_info" : compiler.aux_info
+        }
+        if hasattr(compiler, "all_warnings_output"):
+            result["all_warnings_return_code"] = compiler.all_warnings_return_code
+            result["all_warnings_output"] = compiler.all_warnings_output
+        if compiler.sanitized_return_code is not None:
+            result["sanitized_return_code"] = compiler.sanitized_return_code
+            result["sanitized_output"] = compiler.sanitized_output
+        
+        folder = self._entry_folder(self.key(compiler))
+        os.makedirs(os.path.dirname(folder), exist_ok=True)
+        # the entry is first populated in a temporary folder and then atomically renamed so that concurrent
+        # runs never see incomplete entries
+        tmp_folder = tempfile.mkdtemp(dir=os.path.dirname(folder))
+        try:
+            if compiler.compiled():
+                shutil.copy2(compiler.exe_file, os.path.join(tmp_folder, CompilationCache.EXE_FILE))
+            if compiler.sanitized():
+                shutil.copy2(compiler.sanitized_exe_file, os.path.join(tmp_folder, CompilationCache.SANITIZED_EXE_FILE))
+            with open(os.path.join(tmp_folder, CompilationCache.RESULT_FILE), "w") as f:
+                json.dump(result, f)
+            os.rename(tmp_folder, folder)
+        except OSError:
+            # most likely another process stored the same entry in the meantime
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            
+        self._evict()
+            
+    def _evict(self):
+        entries = []
+        total_size = 0
+        for root, _, files in os.walk(self.folder):
+            if CompilationCache.RESULT_FILE not in files:
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(root, f)) for f in files)
+                last_used = os.path.getmtime(os.path.join(root, CompilationCache.RESULT_FILE))
+            except OSError:
+                continue
+            entries.append((last_used, size, root))
+            total_size += size
+            
+        entries.sort()
+        while total_size > self.max_size and len(entries) > 0:
+            _, size, root = entries.pop(0)
+            shutil.rmtree(root, ignore_errors=True)
+            total_size -= size
 
 
 class Compiler:
     RE_GCC_WITH_COLUMN = re.compile('^(.*):(\\d+):(\\d+):.*?(warning|error):(.*)$')
     RE_GCC_WITHOUT_COLUMN = re.compile('^(.*):(\\d+):.*?(warning|error):(.*)$')
     RE_GCC_LINKER = re.compile('^(.*):(.*): (undefined reference)(.*)$')
+    RE_WARNING_OPTION = re.compile('\\[(-W[^\\]]+)\\]\\s*$')
     
     def __init__(self, options):
         self.options = options
@@ -48,6 +297,12 @@ class Compiler:
         if self.options["valgrind"]["enable"]:
             self.command += " -g2"
             self.all_warnings_command += " -g2"
+            
+        # the sanitizer backend needs an additional executable, built with the same command plus the sanitizer flags
+        self.sanitizer_enabled = self.options["valgrind"]["enable"] and self.options["valgrind"]["backend"] == "sanitizer"
+        self.sanitized_command = f"{self.command} {self.options['valgrind']['sanitizer_flags']}"
+        self.sanitized_return_code = None
+        self.sanitized_output = ""
         
         self.warnings = list()
         self.all_warnings = list()
@@ -56,6 +311,14 @@ class Compiler:
         self.source_file = options["filename"]
         exe_name = os.path.splitext(os.path.basename(self.source_file))[0]
         self.exe_file = os.path.join(os.getcwd(), exe_name)
+        self.sanitized_exe_file = self.exe_file + "_sanitized"
+        
+        # the prototypes of the functions defined in the source, as written by gcc's -aux-info, used by the parser
+        self.aux_info_enabled = self.options["parsing"]["backend"] == "compiler" and supports_aux_info(self.command.split()[0])
+        self.aux_info_file = self.exe_file + ".aux"
+        self.aux_info = None
+        
+        self.json_diagnostics = self.options["compilation"]["diagnostics_format"] == "json" and supports_json_diagnostics(self.command.split()[0])
         
         if not os.path.isfile(self.source_file):
             raise Exception(f"Source file '{self.source_file}' does not exist or it is not accessible")
@@ -73,8 +336,27 @@ class Compiler:
         if self.all_warnings:
             lines.append("\tCompiling with all warnings enabled found {} warnings".format(len(self.all_warnings)))
             
+        if self.sanitizer_enabled and self.compiled() and not self.sanitized():
+            lines.append("\tCompiling with sanitizers: FAILED")
+            
         return "\n".join(lines)
 
+    def to_dict(self):
+        d = {
+            "command" : self.command,
+            "compiled" : self.compiled(),
+            "return_code" : self.regular_return_code,
+            "errors" : [asdict(e) for e in self.errors],
+            "warnings" : [asdict(w) for w in self.warnings]
+        }
+        if self.options["compilation"]["all_warnings"]:
+            d["all_warnings_command"] = self.all_warnings_command
+            d["all_warnings"] = [asdict(w) for w in self.all_warnings]
+        if self.sanitizer_enabled:
+            d["sanitized_command"] = self.sanitized_command
+            d["sanitized"] = self.sanitized()
+        return d
+        
     def _severity(self, message):
         if "error" in message:
             return "error"
@@ -87,18 +369,18 @@ class Compiler:
         
     def _entry_with_column(self, m):
         file_ = m.group(1).strip()
-        lineno = m.group(2)
-        column = m.group(3)
+        lineno = int(m.group(2))
+        column = int(m.group(3))
         severity = self._severity(m.group(4))
         message = m.group(5)
-        return Entry(file_, severity, message, lineno, column)
+        return Entry(file_, severity, message, lineno, column, self._warning_option(message))
 
     def _entry_without_column(self, m):
         file_ = m.group(1).strip()
-        lineno = m.group(2)
+        lineno = int(m.group(2))
         severity = self._severity(m.group(3))
         message = m.group(4)
-        return Entry(file_, severity, message, lineno)
+        return Entry(file_, severity, message, lineno, option=self._warning_option(message))
     
     def _entry_linker(self, m):
         file_ = m.group(1).strip()
@@ -121,33 +403,149 @@ class Compiler:
                     return self._entry_linker(m)
             
         return None
+    
+    def _entry_from_diagnostic(self, diagnostic):
+        location = {}
+        if len(diagnostic.get("locations", [])) > 0:
+            location = diagnostic["locations"][0].get("caret", {})
+        option = diagnostic.get("option")
+        
+        # the message is given the same form it has in the text output, so that the reports do not depend on the format
+        message = " " + diagnostic["message"]
+        if option is not None:
+            message += f" [{option}]"
+            
+        fixits = []
+        for fixit in diagnostic.get("fixits", []):
+            fixits.append({
+                "line" : fixit["start"]["line"],
+                "column" : fixit["start"]["column"],
+                "next_column" : fixit["next"]["column"],
+                "string" : fixit["string"]
+            })
+        
+        return Entry(location.get("file", ""), self._severity(diagnostic["kind"]), message, 
+                     location.get("line"), location.get("column"), option, fixits)
+    
+    def _entries(self, output):
+        '''
+        Yield the entries found in the output of the compiler. JSON diagnostics, which gcc prints as an array on 
+        a single line, are decoded in one go, while everything else (e.g. the linker output) is parsed line by line
+        '''
+        for line in output.splitlines():
+            if self.json_diagnostics and line.startswith("["):
+                try:
+                    diagnostics = json.loads(line)
+                except ValueError:
+                    diagnostics = None
+                if isinstance(diagnostics, list):
+                    for diagnostic in diagnostics:
+                        yield self._entry_from_diagnostic(diagnostic)
+                    continue
+                
+            entry = self._entry_from_line(line)
+            if entry is not None:
+                yield entry
+        
+    def _invoke_compiler(self, name, command, exe_file=None, aux_info=False):
+        if exe_file is None:
+            exe_file = self.exe_file
+        extra_flags = []
+        if aux_info:
+            extra_flags = ["-aux-info", self.aux_info_file]
+        if self.json_diagnostics:
+            extra_flags.append("-fdiagnostics-format=json")
+        with profiler.span(name, "compilation", command=command):
+            return_code, output = run_and_capture(command.split() + extra_flags + ["-o", exe_file, self.source_file] + self.command_post.split())
+        
+        if aux_info:
+            try:
+                with open(self.aux_info_file) as f:
+                    self.aux_info = f.read()
+                os.remove(self.aux_info_file)
+            except OSError:
+                # e.g. if the compilation failed early
+                self.aux_info = None
         
-    def _invoke_compiler(self, command):
-        result = sp.run(command.split() + ["-o", self.exe_file, self.source_file] + self.command_post.split(), stdout=sp.PIPE, stderr=sp.STDOUT, text=True)
-        return result.returncode, result.stdout
+        return return_code, output
         
+    def artifacts(self):
+        paths = []
+        if self.compiled():
+            paths.append(self.exe_file)
+        if self.sanitized():
+            paths.append(self.sanitized_exe_file)
+        return paths
+    
     def compiled(self):
         return self.regular_return_code == 0
+    
+    def sanitized(self):
+        return self.sanitized_return_code == 0
         
     def compile(self):
-        self.regular_return_code, self.regular_output = self._invoke_compiler(self.command)
+        cache = None
+        if self.options["compilation"]["cache"]:
+            cache = CompilationCache(self.options)
+            if cache.load(self):
+                return
+        
+        self._compile()
+        if self.sanitizer_enabled and self.compiled():
+            self.sanitized_return_code, self.sanitized_output = self._invoke_compiler("sanitized compilation", self.sanitized_command, self.sanitized_exe_file)
+        
+        if cache is not None:
+            cache.store(self)
             
-        for line in self.regular_output.splitlines():
-            entry = self._entry_from_line(line)
-            if entry is not None:
-                if entry.severity == 'warning':
-                    self.warnings.append(entry)
-                if entry.severity == 'error' or entry.severity == "linker":
-                    self.errors.append(entry)
+    def _compile(self):
+        baseline_warnings = None
+        if self.options["compilation"]["all_warnings"] and self.options["compilation"]["single_invocation"] and \
+                single_invocation_possible(self.command, self.all_warnings_command):
+            baseline_warnings = enabled_warnings(self.command)
+            
+        if baseline_warnings is not None:
+            self._compile_once(baseline_warnings)
+            return
+        
+        self.regular_return_code, self.regular_output = self._invoke_compiler("regular compilation", self.command, aux_info=self.aux_info_enabled)
+            
+        for entry in self._entries(self.regular_output):
+            if entry.severity == 'warning':
+                self.warnings.append(entry)
+            if entry.severity == 'error' or entry.severity == "linker":
+                self.errors.append(entry)
                     
         if self.options["compilation"]["all_warnings"]:
-            self.all_warnings_return_code, self.all_warnings_output = self._invoke_compiler(self.all_warnings_command)
+            self.all_warnings_return_code, self.all_warnings_output = self._invoke_compiler("all warnings compilation", self.all_warnings_command)
             
-            for line in self.all_warnings_output.splitlines():
-                entry = self._entry_from_line(line)
-                if entry is not None and entry.severity == "warning":
+            for entry in self._entries(self.all_warnings_output):
+                if entry.severity == "warning":
                     self.all_warnings.append(entry)
-                    
+
+    def _warning_option(self, message):
+        m = Compiler.RE_WARNING_OPTION.search(message)
+        if m:
+            return m.group(1)
+        return None
+
+    def _compile_once(self, baseline_warnings):
+        '''
+        Compile with the all_warnings_command only, and then use the set of warnings enabled by the regular
+        command to figure out which of the warnings would have been emitted by the regular compilation.
+        The caller makes sure that all_warnings_command differs from command only by the warnings it enables
+        '''
+        self.regular_return_code, self.regular_output = self._invoke_compiler("single compilation", self.all_warnings_command, aux_info=self.aux_info_enabled)
+        self.all_warnings_return_code, self.all_warnings_output = self.regular_return_code, self.regular_output
+
+        for entry in self._entries(self.regular_output):
+            if entry.severity == 'warning':
+                self.all_warnings.append(entry)
+                # warnings that cannot be mapped back to an option are conservatively attributed to the regular command too
+                if entry.option is None or baseline_warnings.get(entry.option) is not False:
+                    self.warnings.append(entry)
+            if entry.severity == 'error' or entry.severity == "linker":
+                self.errors.append(entry)
+
     def write_report(self):
         with open(self.options["compilation"]["report_path"], "w") as f:
             if self.compiled():
@@ -170,3 +568,7 @@ class Compiler:
                 for w in self.all_warnings:
                     print(w, file=f)
                     
+            if self.sanitized_return_code is not None and not self.sanitized():
+                print_log_section(f"OUTPUT FOR '{self.sanitized_command}'", f)
+                print(self.sanitized_output, file=f)
+                    
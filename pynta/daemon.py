@@ -0,0 +1,337 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+from dataclasses import asdict
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+import sys, os, copy, json, queue, select, signal, socket, socketserver, threading, itertools, argparse
+
+from batch import BatchInput, grade, load_references, _submission_options
+from reference import cache as reference_cache
+from runner import kill_running
+
+
+class _Progress:
+    '''
+    A file-like object that sends each line printed by Analyser.run back to the daemon
+    '''
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.buffer = ""
+
+    def write(self, s):
+        self.buffer += s
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            self.connection.send(("progress", line))
+
+    def flush(self):
+        pass
+
+
+def _terminate(signum, frame):
+    kill_running()
+    os._exit(1)
+
+
+def _work(connection):
+    # each worker leads its own process group, so that cancelling a job also kills the compilers it has launched
+    os.setsid()
+    # the daemon takes care of shutting down the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _terminate)
+    # the references loaded by a job stay in memory for the next ones
+    reference_cache.enabled = True
+
+    while True:
+        try:
+            options = connection.recv()
+        except EOFError:
+            return
+        result = grade(options, _Progress(connection))
+        connection.send(("result", result))
+
+
+class Worker:
+    '''
+    A warm process that grades one job at a time
+    '''
+
+    def __init__(self):
+        self.connection, child_connection = Pipe()
+        self.process = Process(target=_work, args=(child_connection,), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def receive(self):
+        '''
+        Wait for the next message of the worker, and raise EOFError if it dies. Workers forked later inherit the
+        worker's end of the pipe, and therefore its death cannot be detected by the end of the pipe alone
+        '''
+        wait([self.connection, self.process.sentinel])
+        if self.connection.poll():
+            return self.connection.recv()
+        raise EOFError
+
+    def kill(self):
+        # the worker first gets rid of the programs it is running, which are not part of its process group
+        self.process.terminate()
+        self.process.join(1)
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            # the worker may not have become a group leader yet
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class Job:
+
+    def __init__(self, job_id, options, priority, send):
+        self.id = job_id
+        self.options = options
+        self.priority = priority
+        # "queued", "running" or "finished"
+        self.state = "queued"
+        self.cancelled = False
+        self.worker = None
+        self.done = threading.Event()
+        self._send = send
+
+    def send(self, event, **data):
+        '''
+        Send an event to the client, returning False if the client has gone away
+        '''
+        message = {"event" : event, "job" : self.id}
+        message.update(data)
+        try:
+            self._send(json.dumps(message) + "\n")
+        except OSError:
+            return False
+        return True
+
+
+class Daemon:
+    '''
+    Grades the submitted jobs, highest priority first, with a pool of warm worker processes. Configurations are parsed
+    once and kept in memory until the file changes
+    '''
+
+    def __init__(self, processes, configs=()):
+        self.lock = threading.Lock()
+        self.queue = queue.PriorityQueue()
+        # queued and running jobs
+        self.jobs = {}
+        self.counter = itertools.count(1)
+        self.configs = {}
+
+        # the references of the preloaded configurations are shared by all the workers, which are forked afterwards
+        for path in configs:
+            options = self.load_config(path)
+            template = copy.copy(options)
+            template["working_dir"] = os.path.abspath(options["working_dir"])
+            load_references(template)
+
+        if processes <= 0:
+            processes = os.cpu_count()
+        self.workers = [Worker() for _ in range(processes)]
+        for i in range(processes):
+            threading.Thread(target=self._manage, args=(i,), daemon=True).start()
+
+    def load_config(self, path):
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime_ns
+        with self.lock:
+            cached = self.configs.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            options = BatchInput(path)
+        except SystemExit:
+            # Input reports the problem on the standard error and quits
+            raise Exception(f"Invalid input file '{path}'")
+        with self.lock:
+            self.configs[path] = (mtime, options)
+        return options
+
+    def submit(self, config, filename, cwd, priority, send):
+        options = self.load_config(os.path.join(cwd, config))
+        filename = os.path.abspath(os.path.join(cwd, filename))
+        if not os.path.isfile(filename):
+            raise Exception(f"Source file '{filename}' does not exist or it is not accessible")
+
+        # relative paths are resolved with respect to the folder of the client, as pynta.py would do
+        template = copy.copy(options)
+        template["working_dir"] = os.path.join(cwd, options["working_dir"])
+        with self.lock:
+            job_id = next(self.counter)
+            # submissions with the same name that are graded at the same time need different folders
+            name = os.path.splitext(os.path.basename(filename))[0]
+            if any(job.options["working_dir"] == os.path.join(template["working_dir"], name) for job in self.jobs.values()):
+                name = f"{name}_{job_id}"
+            job = Job(job_id, _submission_options(template, filename, name), priority, send)
+            self.jobs[job_id] = job
+        job.send("queued", priority=priority, working_dir=job.options["working_dir"])
+        self.queue.put((-priority, job_id, job))
+        return job
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.cancelled:
+                return False
+            job.cancelled = True
+            queued = job.state == "queued"
+            if queued:
+                self._remove(job)
+            else:
+                # the worker is restarted by the thread that manages it
+                job.worker.kill()
+        if queued:
+            self._finish(job, "cancelled")
+        return True
+
+    def status(self):
+        with self.lock:
+            return [{"job" : job.id, "state" : job.state, "priority" : job.priority, "filename" : job.options["filename"]}
+                    for job in self.jobs.values()]
+
+    def _remove(self, job):
+        job.state = "finished"
+        del self.jobs[job.id]
+
+    def _finish(self, job, event, **data):
+        # the connection with the client is closed as soon as the job is done
+        job.send(event, **data)
+        job.done.set()
+
+    def _manage(self, i):
+        while True:
+            _, _, job = self.queue.get()
+            with self.lock:
+                if job.state != "queued":
+                    continue
+                job.state = "running"
+                job.worker = worker = self.workers[i]
+            job.send("started")
+
+            result = None
+            try:
+                worker.connection.send(job.options)
+                while True:
+                    kind, payload = worker.receive()
+                    if kind == "result":
+                        result = payload
+                        break
+                    if not job.send("progress", summary=payload):
+                        # nobody is waiting for the result anymore
+                        self.cancel(job.id)
+            except (EOFError, OSError):
+                pass
+
+            with self.lock:
+                if result is None or job.cancelled:
+                    # the worker has been killed (or has crashed) and has to be replaced
+                    if worker.process.is_alive():
+                        worker.kill()
+                    self.workers[i] = Worker()
+                self._remove(job)
+
+            if job.cancelled:
+                self._finish(job, "cancelled")
+            elif result is None:
+                self._finish(job, "error", message="The worker grading the job has crashed")
+            else:
+                data = asdict(result)
+                data["status"] = result.status()
+                self._finish(job, "result", **data)
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.kill()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    '''
+    Serves a single request, which is a JSON document written on a single line. The replies are streamed back as
+    JSON documents, one per line
+    '''
+
+    def _send(self, data):
+        self.wfile.write(data.encode())
+
+    def _client_gone(self):
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        return len(readable) > 0 and self.connection.recv(1, socket.MSG_PEEK) == b""
+
+    def _reply(self, event, **data):
+        message = {"event" : event}
+        message.update(data)
+        self._send(json.dumps(message) + "\n")
+
+    def handle(self):
+        daemon = self.server.daemon
+        try:
+            request = json.loads(self.rfile.readline())
+            command = request["command"]
+            if command == "grade":
+                job = daemon.submit(request["config"], request["filename"], request.get("cwd", os.getcwd()),
+                                    request.get("priority", 0), self._send)
+                while not job.done.wait(0.5):
+                    if self._client_gone():
+                        daemon.cancel(job.id)
+            elif command == "cancel":
+                self._reply("cancel", job=request["job"], ok=daemon.cancel(request["job"]))
+            elif command == "status":
+                self._reply("status", jobs=daemon.status())
+            else:
+                self._reply("error", message=f"Unknown command '{command}'")
+        except (ValueError, KeyError) as e:
+            self._reply("error", message=f"Invalid request: {e}")
+        except OSError:
+            # the client has gone away
+            pass
+        except Exception as e:
+            self._reply("error", message=str(e))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon):
+        self.daemon = daemon
+        super().__init__(socket_path, _Handler)
+
+
+def serve(args):
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+
+    daemon = Daemon(args.processes, args.configs)
+    server = Server(args.socket, daemon)
+    # a SIGTERM shuts the daemon down as cleanly as a CTRL+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Listening on {args.socket} with {len(daemon.workers)} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.shutdown()
+        os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Grade the submissions sent by client.py with a pool of warm worker processes")
+    parser.add_argument("socket", help="path of the UNIX socket the daemon listens on")
+    parser.add_argument("configs", nargs="*", help="input files to be loaded (together with their references) in advance")
+    parser.add_argument("-p", "--processes", type=int, default=0, help="number of worker processes (0 means one per core)")
+    
+    serve(parser.parse_args())
@@ -0,0 +1,85 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+import os, json, pickle, hashlib, tempfile
+
+# stored results are discarded whenever the format of the stages changes
+STATE_VERSION = 1
+
+
+def digest(*parts):
+    '''
+    A fingerprint of the given (JSON-serialisable) parts
+    '''
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(json.dumps(part, sort_keys=True, default=str).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def file_digest(path):
+    '''
+    The SHA-256 of the content of the file, or None if it does not exist
+    '''
+    try:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+    except OSError:
+        return None
+
+
+def file_signature(path):
+    '''
+    The modification time and size of the file, or None if it does not exist
+    '''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class StageState:
+    '''
+    The stages of the last analysis, each stored together with the fingerprint of its inputs and with the signatures of
+    the files it has produced. A stored stage can be reused if its fingerprint has not changed and its files have not
+    been touched since
+    '''
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.folder, f"{name}.pickle")
+
+    def load(self, name, fingerprint):
+        try:
+            with open(self._path(name), "rb") as f:
+                version, stored_fingerprint, signatures, stage = pickle.load(f)
+        # missing, corrupted or stale (i.e. written by a different version of the code) states are simply ignored
+        except Exception:
+            return None
+
+        if version != STATE_VERSION or stored_fingerprint != fingerprint:
+            return None
+        for path, signature in signatures.items():
+            if file_signature(path) != signature:
+                return None
+        return stage
+
+    def store(self, name, fingerprint, stage, artifacts=()):
+        signatures = {path : file_signature(path) for path in artifacts}
+        data = pickle.dumps((STATE_VERSION, fingerprint, signatures, stage))
+        # the state is replaced atomically, so that an interrupted run cannot leave a truncated file behind
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(name))
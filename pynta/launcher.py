@@ -4,37 +4,63 @@ Created on Dec 27, 2022
 @author: lorenzo
 '''
 
-import signal, os, sys
-import subprocess as sp
+import signal, os, sys, re, glob, mmap, shutil
+from collections import Counter
+from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
 import defusedxml.ElementTree as et
 
 from utils import print_log_section
+from runner import Limits, run_process
+from sandbox import Sandbox
+from profiler import profiler
+
+
+def _intern(s: Optional[str]) -> Optional[str]:
+    '''
+    Paths, function names and error kinds are repeated over and over in large logs, so we keep a single copy of each
+    '''
+    if s is None:
+        return None
+    return sys.intern(s)
 
 
 class Error:
+    __slots__ = ("stack", "what", "kind", "unique", "count", "auxstack", "auxwhat", "_first_source")
 
-    def __init__(self, tag) -> None:
+    def __init__(self, tag=None) -> None:
         self.stack: List[Frame] = []
+        # number of occurrences of this error, which can be larger than one if errors are deduplicated
+        self.count = 1
+        self.auxstack: List[Frame] = []
+        self.auxwhat: Optional[str] = None
+        # index of the first source frame, for each source dir it has been looked up with
+        self._first_source = {}
+        # errors that do not come from valgrind (see SanitizerData) are built attribute by attribute
+        if tag is None:
+            self.what = ""
+            self.kind = ""
+            self.unique = 0
+            return
+        
         # bugfix-issue#1: valgrind 3.15.0 does not generate
         # [what] xml tag, [xwhat] is generated instead
         what_tag = tag.find("what")
         if what_tag is not None:
-            self.what: str = what_tag.text
+            self.what: str = _intern(what_tag.text)
         else:
             what_tag = tag.find("xwhat/text")
             if what_tag is None:
                 raise ValueError("Cannot find either <what> or <xwhat> tags")
             else:
-                self.what = what_tag.text
-        self.kind: str = tag.find("kind").text
+                self.what = _intern(what_tag.text)
+        self.kind: str = _intern(tag.find("kind").text)
         self.unique = int(tag.find("unique").text, 16)
         for frame in tag.find("stack").findall("frame"):
             if frame.find("obj") is not None:
                 self.stack.append(Frame(frame))
 
-        self.auxstack: List[Frame] = []
-        self.auxwhat: Optional[str] = None
         auxwhat = tag.find("auxwhat")
         stack_2 = tag.find("./stack[2]")
         if auxwhat is not None and stack_2 is not None:
@@ -45,6 +71,8 @@ class Error:
 
     def __str__(self) -> str:
         s = f"{self.what} (0x{self.unique:x})"
+        if self.count > 1:
+            s += f" [{self.count} occurrences]"
         for i, frame in enumerate(self.stack):
             s += f"\n#{i} => {frame}"
         if self.auxwhat is not None:
@@ -53,7 +81,25 @@ class Error:
                 s += f"\n#{i} => {frame}"
         return s
 
+    def to_dict(self) -> dict:
+        d = {
+            "kind" : self.kind,
+            "what" : self.what,
+            "unique" : self.unique,
+            "count" : self.count,
+            "stack" : [frame.to_dict() for frame in self.stack]
+        }
+        if self.auxwhat is not None:
+            d["auxwhat"] = self.auxwhat
+            d["auxstack"] = [frame.to_dict() for frame in self.auxstack]
+        return d
+
     def find_first_source_reference(self, source_dir: Optional[str]) -> Optional[int]:
+        if source_dir not in self._first_source:
+            self._first_source[source_dir] = self._find_first_source_reference(source_dir)
+        return self._first_source[source_dir]
+
+    def _find_first_source_reference(self, source_dir: Optional[str]) -> Optional[int]:
         for i, frame in enumerate(self.stack):
             filename = frame.get_path(None)
             if filename is not None and os.path.isabs(filename):
@@ -64,24 +110,44 @@ class Error:
                     return i
         return None
 
+    def dedupe_key(self):
+        '''
+        Errors of the same kind that originate from the same source line are considered duplicates
+        '''
+        f = self.find_first_source_reference(None)
+        if f is not None:
+            return self.kind, self.stack[f].get_path(None), self.stack[f].line
+        if len(self.stack) > 0:
+            return self.kind, self.stack[0].func
+        return self.kind, self.what
 
-class Frame:
 
-    def __init__(self, tag) -> None:
-        self.obj = tag.find("obj").text
+class Frame:
+    __slots__ = ("obj", "func", "folder", "filename", "line")
+
+    def __init__(self, tag=None) -> None:
+        if tag is None:
+            self.obj: Optional[str] = None
+            self.func: Optional[str] = None
+            self.folder: Optional[str] = None
+            self.filename: Optional[str] = None
+            self.line: Optional[int] = None
+            return
+        
+        self.obj = _intern(tag.find("obj").text)
         func = tag.find("fn")
         if func is not None:
-            self.func: Optional[str] = tag.find("fn").text
+            self.func: Optional[str] = _intern(func.text)
         else:
             self.func = None
         folder = tag.find("dir")
         if folder is not None:
-            self.folder: Optional[str] = folder.text
+            self.folder: Optional[str] = _intern(folder.text)
             source_file = tag.find("file")
             line = tag.find("line")
             assert source_file is not None
             assert line is not None
-            self.filename: Optional[str] = source_file.text
+            self.filename: Optional[str] = _intern(source_file.text)
             self.line: Optional[int] = int(line.text)
         else:
             self.folder = None
@@ -93,6 +159,14 @@ class Frame:
             return "{}:{}".format(self.get_path(None), self.line)
         return self.func or ""
 
+    def to_dict(self) -> dict:
+        return {
+            "obj" : self.obj,
+            "func" : self.func,
+            "file" : self.get_path(None),
+            "line" : self.line
+        }
+
     def get_path(self, source_dir: Optional[str]) -> Optional[str]:
         if self.folder is not None and self.filename is not None:
             filename = os.path.join(self.folder, self.filename)
@@ -106,124 +180,347 @@ class ValgrindData:
 
     def __init__(self) -> None:
         self.errors: List[Error] = []
+        # number of errors of each kind that have been parsed but not stored
+        self.omitted: Counter = Counter()
         self._source_dir: Optional[str] = None
-
-    def parse(self, xml_file: str) -> None:
-        root = et.parse(xml_file).getroot()
-        for error_tag in root.findall("error"):
-            self.errors.append(Error(error_tag))
+        self._index: Optional[dict] = None
+
+    def parse(self, xml_file: str, dedupe: bool = False, max_errors: int = 0) -> None:
+        '''
+        Parse the log incrementally, discarding each <error> element as soon as it has been processed. If dedupe
+        is True, duplicate errors (see Error.dedupe_key) are stored only once together with their number of
+        occurrences. If max_errors > 0, only the first max_errors (distinct) errors are stored, and the others
+        are just counted
+        '''
+        root = None
+        seen = {}
+        for event, tag in et.iterparse(xml_file, events=("start", "end")):
+            if root is None:
+                root = tag
+            if event != "end" or tag.tag != "error":
+                continue
+            
+            # once the cap has been reached, errors are only counted, unless they may be duplicates of stored ones
+            if not dedupe and max_errors > 0 and len(self.errors) >= max_errors:
+                self.omitted[_intern(tag.findtext("kind"))] += 1
+                root.clear()
+                continue
+            
+            error = Error(tag)
+            # drop everything that has been parsed so far
+            root.clear()
+            self._store(error, seen, dedupe, max_errors)
+
+        self._index = None
+
+    def _store(self, error: Error, seen: dict, dedupe: bool, max_errors: int) -> None:
+        if dedupe:
+            key = error.dedupe_key()
+            if key in seen:
+                seen[key].count += 1
+                return
+            
+        if max_errors > 0 and len(self.errors) >= max_errors:
+            self.omitted[error.kind] += 1
+            return
+        
+        if dedupe:
+            seen[key] = error
+        self.errors.append(error)
 
     def set_source_dir(self, source_dir: Optional[str]) -> None:
         if source_dir is not None:
             self._source_dir = os.path.abspath(source_dir)
         else:
             self._source_dir = None
+        self._index = None
 
-    def get_num_errors(self) -> int:
-        if self._source_dir is None:
-            return len(self.errors)
-
-        num_errors = 0
-        if self._source_dir is None:
-            return len(self.errors)
+    def _subset(self, errors: List[Error]):
+        data = ValgrindData()
+        data._source_dir = self._source_dir
+        data.errors = list(errors)
+        return data
 
+    def _get_index(self) -> dict:
+        '''
+        Group the errors by kind, source file, line and function in a single pass. The index is built on first
+        use and thrown away whenever the errors or the source dir change
+        '''
+        if self._index is not None:
+            return self._index
+
+        index = {
+            "kind": {},
+            "file": {},
+            "line": {},
+            "function": {},
+            "num_errors": sum(self.omitted.values()),
+        }
         for error in self.errors:
-            if error.find_first_source_reference(self._source_dir) is not None:
-                num_errors += 1
-        return num_errors
+            index["kind"].setdefault(error.kind, []).append(error)
+
+            f = error.find_first_source_reference(self._source_dir)
+            if f is not None:
+                index["num_errors"] += error.count
+                frame = error.stack[f]
+                filename = frame.get_path(self._source_dir)
+                if filename is not None:
+                    index["file"].setdefault(filename, []).append(error)
+                if frame.line is not None:
+                    index["line"].setdefault(frame.line, []).append(error)
+            else:
+                if self._source_dir is None:
+                    index["num_errors"] += error.count
+                f = 0
+
+            if f < len(error.stack) and error.stack[f].func is not None:
+                index["function"].setdefault(error.stack[f].func, []).append(error)
+
+        self._index = index
+        return index
+
+    def get_num_errors(self) -> int:
+        # omitted errors are always counted, since they cannot be filtered
+        return self._get_index()["num_errors"]
 
     def filter_error_kind(self, kind: str):
-        data: ValgrindData = ValgrindData()
-        data._source_dir = self._source_dir
-        for error in self.errors:
-            if error.kind == kind:
-                data.errors.append(error)
-        return data
+        return self._subset(self._get_index()["kind"].get(kind, []))
 
     def filter_source_file(self, filename: str):
-        data = ValgrindData()
-        data._source_dir = self._source_dir
-        for error in self.errors:
-            f = error.find_first_source_reference(self._source_dir)
-            if f is None:
-                continue
-            if error.stack[f].get_path(self._source_dir) == filename:
-                data.errors.append(error)
-        return data
+        return self._subset(self._get_index()["file"].get(filename, []))
 
     def filter_line(self, line: int):
-        data = ValgrindData()
-        data._source_dir = self._source_dir
-        for error in self.errors:
-            f = error.find_first_source_reference(self._source_dir)
-            if f is None:
-                continue
-            if error.stack[f].line == line:
-                data.errors.append(error)
-        return data
+        return self._subset(self._get_index()["line"].get(line, []))
 
     def filter_function(self, function: str):
-        data = ValgrindData()
-        data._source_dir = self._source_dir
-        for error in self.errors:
-            f = error.find_first_source_reference(self._source_dir)
-            if f is None:
-                f = 0
-
-            if error.stack[f].func == function:
-                data.errors.append(error)
-        return data
+        return self._subset(self._get_index()["function"].get(function, []))
 
     def list_error_kinds(self) -> List[str]:
-        error_kinds = []
-        for error in self.errors:
-            if error.kind not in error_kinds:
-                error_kinds.append(error.kind)
-        return error_kinds
+        return list(self._get_index()["kind"])
 
     def list_source_files(self) -> List[str]:
-        source_files = []
-        for error in self.errors:
-            f = error.find_first_source_reference(self._source_dir)
-            if f is None:
-                continue
-            filename = error.stack[f].get_path(self._source_dir)
-            if filename is not None and filename not in source_files:
-                source_files.append(filename)
-        return source_files
+        return list(self._get_index()["file"])
 
     def list_lines(self) -> List[int]:
-        lines = []
-        for error in self.errors:
-            f = error.find_first_source_reference(self._source_dir)
-            if f is None:
-                continue
-            line = error.stack[f].line
-            if line is not None and line not in lines:
-                lines.append(line)
-        return lines
+        return list(self._get_index()["line"])
 
     def list_functions(self) -> List[str]:
-        functions = []
-        for error in self.errors:
-            f = error.find_first_source_reference(self._source_dir)
-            if f is None:
-                f = 0
+        return list(self._get_index()["function"])
+
+
+class SanitizerData(ValgrindData):
+    '''
+    The errors reported by AddressSanitizer, LeakSanitizer and UndefinedBehaviorSanitizer, parsed from their
+    textual reports into the same Error and Frame objects used for valgrind. Leaks are given the same kinds
+    valgrind uses for them
+    '''
+    RE_HEADER = re.compile(r"^==\d+==ERROR: (\w+Sanitizer): (.*?)(?: at pc 0x\S+ bp 0x\S+ sp 0x\S+)?$")
+    RE_ACCESS = re.compile(r"^((?:READ|WRITE) of size \d+)")
+    RE_SUMMARY = re.compile(r"^SUMMARY: \w+Sanitizer: (\S+)")
+    RE_LEAK = re.compile(r"^(Direct|Indirect) (leak of .*) allocated from:$")
+    RE_UNDEFINED = re.compile(r"^(.*?):(\d+):\d+: runtime error: (.*)$")
+    RE_FRAME = re.compile(
+        r"^\s+#\d+ 0x[0-9a-fA-F]+\s+(?:in (.+?) )?"
+        r"(?:\((.+?)\+0x[0-9a-fA-F]+\)(?: \(BuildId: \w+\))?|(.+?):(\d+)(?::\d+)?)$"
+    )
+    LEAK_KINDS = {
+        "Direct" : "Leak_DefinitelyLost",
+        "Indirect" : "Leak_IndirectlyLost"
+    }
+
+    @staticmethod
+    def _frame(m) -> Frame:
+        frame = Frame()
+        frame.func = _intern(m.group(1))
+        frame.obj = _intern(m.group(2))
+        if m.group(3) is not None:
+            folder, filename = os.path.split(m.group(3))
+            frame.folder = _intern(folder)
+            frame.filename = _intern(filename)
+            frame.line = int(m.group(4))
+        return frame
+
+    def parse(self, log_file: str, dedupe: bool = False, max_errors: int = 0) -> None:
+        seen = {}
+        error = None
+        # the list the next frames are appended to, or None if they should be ignored
+        stack = None
+        
+        def store():
+            if error is not None:
+                self._store(error, seen, dedupe, max_errors)
+            return None, None
+        
+        with open(log_file, "r", errors="replace") as f:
+            for line in f:
+                line = line.rstrip()
+                
+                m = SanitizerData.RE_FRAME.match(line)
+                if m:
+                    if stack is not None:
+                        stack.append(SanitizerData._frame(m))
+                    continue
+                
+                m = SanitizerData.RE_HEADER.match(line)
+                if m:
+                    error, stack = store()
+                    # leaks are reported one by one after the header
+                    if m.group(1) != "LeakSanitizer":
+                        error = Error()
+                        error.kind = m.group(2).split()[0]
+                        error.what = m.group(2)
+                        stack = error.stack
+                    continue
+                
+                m = SanitizerData.RE_LEAK.match(line)
+                if m:
+                    error, stack = store()
+                    error = Error()
+                    error.kind = SanitizerData.LEAK_KINDS[m.group(1)]
+                    error.what = f"{m.group(1)} {m.group(2)}"
+                    stack = error.stack
+                    continue
+                
+                m = SanitizerData.RE_UNDEFINED.match(line)
+                if m:
+                    error, stack = store()
+                    error = Error()
+                    error.kind = "UndefinedBehavior"
+                    error.what = m.group(3)
+                    stack = error.stack
+                    continue
+                
+                if error is None:
+                    continue
+                
+                m = SanitizerData.RE_SUMMARY.match(line)
+                if m:
+                    # the summary line contains the proper name of the memory error (e.g. double-free)
+                    if error.kind not in SanitizerData.LEAK_KINDS.values():
+                        error.kind = m.group(1)
+                    error, stack = store()
+                    continue
+                
+                m = SanitizerData.RE_ACCESS.match(line)
+                if m and len(error.stack) == 0:
+                    error.what += f" ({m.group(1)})"
+                elif line.endswith(" here:") and error.auxwhat is None:
+                    # e.g. "freed by thread T0 here:"
+                    error.auxwhat = line[0:-1]
+                    stack = error.auxstack
+                elif line == "" and len(error.stack) > 0:
+                    stack = None
+                    
+        store()
+        for i, error in enumerate(self.errors):
+            error.unique = i
+        self._index = None
+
+
+class ValgrindSummary:
+    '''
+    The aggregate numbers of a valgrind log (number of errors of each kind, leaked bytes and blocks, suppressed
+    errors), extracted with a handful of regular expressions rather than by parsing the whole XML tree
+    '''
+    RE_ERROR = re.compile(
+        rb"<error>\s*<unique>(0x[0-9a-fA-F]+)</unique>\s*<tid>\d+</tid>\s*(?:<threadname>[^<]*</threadname>\s*)?"
+        rb"<kind>(\w+)</kind>"
+        rb"(?:\s*<xwhat>\s*<text>[^<]*</text>\s*<leakedbytes>(\d+)</leakedbytes>\s*<leakedblocks>(\d+)</leakedblocks>)?"
+    )
+    RE_ERROR_COUNT = re.compile(rb"<count>(\d+)</count>\s*<unique>(0x[0-9a-fA-F]+)</unique>")
+    RE_SUPP_COUNT = re.compile(rb"<count>(\d+)</count>\s*<name>")
+
+    def __init__(self) -> None:
+        # number of distinct errors of each kind
+        self.kinds: Counter = Counter()
+        # number of times errors of each kind occurred, according to valgrind's own error counts
+        self.occurrences: Counter = Counter()
+        self.leaked_bytes: Counter = Counter()
+        self.leaked_blocks: Counter = Counter()
+        self.suppressed = 0
+        # False if the log has been cut short (e.g. because valgrind was killed)
+        self.complete = False
+
+    def parse(self, xml_file: str) -> None:
+        with open(xml_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self._parse(data)
+
+    def _parse(self, data) -> None:
+        kinds = {}
+        for match in ValgrindSummary.RE_ERROR.finditer(data):
+            unique, kind, leaked_bytes, leaked_blocks = match.groups()
+            kind = kind.decode()
+            kinds[int(unique, 16)] = kind
+            self.kinds[kind] += 1
+            if leaked_bytes is not None:
+                self.leaked_bytes[kind] += int(leaked_bytes)
+                self.leaked_blocks[kind] += int(leaked_blocks)
+
+        self.complete = data.rfind(b"<state>FINISHED</state>") != -1
+
+        # the aggregate sections are written at the very end of the log
+        errorcounts = data.rfind(b"<errorcounts>")
+        if errorcounts != -1:
+            end = data.find(b"</errorcounts>", errorcounts)
+            for count, unique in ValgrindSummary.RE_ERROR_COUNT.findall(data[errorcounts:end]):
+                kind = kinds.get(int(unique, 16))
+                if kind is not None:
+                    self.occurrences[kind] += int(count)
+        # leak errors are not part of the error counts
+        for kind in self.kinds:
+            if kind not in self.occurrences:
+                self.occurrences[kind] = self.kinds[kind]
+
+        suppcounts = data.rfind(b"<suppcounts>")
+        if suppcounts != -1:
+            end = data.find(b"</suppcounts>", suppcounts)
+            self.suppressed = sum(int(c) for c in ValgrindSummary.RE_SUPP_COUNT.findall(data[suppcounts:end]))
+
+    def get_num_errors(self) -> int:
+        return sum(self.kinds.values())
+
+    def leak_summary(self) -> str:
+        leaks = []
+        for kind, description in [("Leak_DefinitelyLost", "definitely"), ("Leak_IndirectlyLost", "indirectly")]:
+            if self.leaked_bytes[kind] > 0:
+                leaks.append(f"{self.leaked_bytes[kind]} bytes {description} lost")
+        return ", ".join(leaks)
 
-            func = error.stack[f].func
-            if func is not None and func not in functions:
-                functions.append(func)
-        return functions
-    
 
 class Launcher:
 
-    def __init__(self, options, exe_file):
+    def __init__(self, options, exe_file, sanitized_exe_file=None, cwd=None):
         self.options = options
         self.exe_file = exe_file
+        # the folder the program is run in, and which relative paths refer to
+        self.cwd = os.path.abspath(cwd) if cwd is not None else os.getcwd()
+        # only required by the sanitizer backend
+        self.sanitized_exe_file = sanitized_exe_file
         self.arguments = self.options["execution"]["arguments"].split()
         self.command = [self.exe_file] + self.arguments
         self.valgrind_enabled = self.options["valgrind"]["enable"]
+        # the memory checks are skipped if they require a sanitized executable that could not be built
+        self.valgrind_skipped = False
+        self.limits = Limits(self.options["execution"])
+        self.valgrind_limits = Limits(self.options["valgrind"])
+        self.backend = self.options["valgrind"]["backend"]
+        if self.backend == "sanitizer":
+            self.backend_name = "Sanitizers"
+            # AddressSanitizer reserves terabytes of virtual memory for its shadow memory, and therefore
+            # it cannot run with a limited address space
+            self.valgrind_limits.memory = 0
+            if self.valgrind_enabled and self.sanitized_exe_file is None:
+                self.valgrind_enabled = False
+                self.valgrind_skipped = True
+        else:
+            self.backend_name = "Valgrind"
+        self.valgrind_xml_file = self._path(self.options["valgrind"]["xml_file"])
+        # if fast_summary is enabled, the log is fully parsed only if (and when) valgrind_data is accessed
+        self.valgrind_summary: Optional[ValgrindSummary] = None
+        self._valgrind_data: Optional[ValgrindData] = None
         
         self.delete_output_files()
         self.execute()
@@ -233,72 +530,287 @@ class Launcher:
         
         if self.success():
             lines.append("Execution: OK")
+        elif self.result.timed_out:
+            lines.append("Execution: TIMEOUT")
+        elif self.result.limit_exceeded() is not None:
+            lines.append(f"Execution: LIMIT EXCEEDED ({self.result.limit_exceeded()})")
         else:
             lines.append("Execution: FAILED")
             
         if self.valgrind_enabled:
-            if self.valgrind_data.get_num_errors() == 0:
-                lines.append("Valgrind: OK")
+            if self.valgrind_result.timed_out:
+                lines.append(f"{self.backend_name}: TIMEOUT")
+            elif self.valgrind_result.limit_exceeded() is not None:
+                lines.append(f"{self.backend_name}: LIMIT EXCEEDED ({self.valgrind_result.limit_exceeded()})")
+            elif self.valgrind_num_errors() == 0:
+                lines.append(f"{self.backend_name}: OK")
             else:
-                lines.append("Valgrind: FAILED ({} error(s))".format(self.valgrind_data.get_num_errors()))
+                details = f"{self.valgrind_num_errors()} error(s)"
+                if self.valgrind_summary is not None and self.valgrind_summary.leak_summary() != "":
+                    details += f"; {self.valgrind_summary.leak_summary()}"
+                lines.append(f"{self.backend_name}: FAILED ({details})")
+        elif self.valgrind_skipped:
+            lines.append(f"{self.backend_name}: SKIPPED (the compilation with sanitizers failed)")
             
         return "\n".join(lines)
         
     def success(self):
         return self.return_code == self.options["execution"]["expected_return_code"]
+
+    @property
+    def valgrind_data(self) -> Optional[ValgrindData]:
+        if self._valgrind_data is None and self.valgrind_enabled:
+            self._valgrind_data = self._parse_valgrind_log(self.valgrind_result)
+        return self._valgrind_data
+
+    def valgrind_num_errors(self) -> int:
+        if self.valgrind_summary is not None:
+            return self.valgrind_summary.get_num_errors()
+        return self.valgrind_data.get_num_errors()
+    
+    def to_dict(self):
+        d = {
+            "command" : self.command,
+            "success" : self.success(),
+            "return_code" : self.return_code,
+            "timed_out" : self.result.timed_out,
+            "limit_exceeded" : self.result.limit_exceeded(),
+            "resources" : self.result.resources,
+            "stdout" : asdict(self.stdout),
+            "stderr" : asdict(self.stderr)
+        }
+        
+        if self.valgrind_enabled:
+            valgrind = {
+                "backend" : self.backend,
+                "return_code" : self.valgrind_result.return_code,
+                "timed_out" : self.valgrind_result.timed_out,
+                "limit_exceeded" : self.valgrind_result.limit_exceeded(),
+                "resources" : self.valgrind_result.resources,
+                "num_errors" : self.valgrind_num_errors()
+            }
+            # the log is not parsed just to build the report if fast_summary is enabled
+            summary = self.valgrind_summary
+            if summary is not None:
+                valgrind["kinds"] = dict(summary.kinds)
+                valgrind["occurrences"] = dict(summary.occurrences)
+                valgrind["leaked_bytes"] = dict(summary.leaked_bytes)
+                valgrind["leaked_blocks"] = dict(summary.leaked_blocks)
+                valgrind["suppressed"] = summary.suppressed
+            else:
+                valgrind["errors"] = [error.to_dict() for error in self.valgrind_data.errors]
+                valgrind["omitted"] = dict(self.valgrind_data.omitted)
+            d["valgrind"] = valgrind
+        elif self.valgrind_skipped:
+            d["valgrind"] = {
+                "backend" : self.backend,
+                "skipped" : True
+            }
+            
+        return d
+    
+    def _path(self, path):
+        return os.path.join(self.cwd, path)
+    
+    def _file_outputs(self):
+        return [output["name"] for output in self.options["output"] if output["type"] == "file"]
+
+    def artifacts(self):
+        '''
+        The files written by the run(s) that are used by the later stages of the analysis
+        '''
+        paths = [self.stdout.path, self.stderr.path]
+        paths += [self._path(name) for name in self._file_outputs()]
+        if self.valgrind_enabled:
+            if self.backend == "sanitizer":
+                paths.append(self._path(self.options["valgrind"]["sanitizer_log"]))
+            else:
+                paths.append(self.valgrind_xml_file)
+        return paths
+    
+    def _generated_files(self):
+        '''
+        The top-level names of the files and folders of cwd that are written by the runs, which are not staged into 
+        the sandboxes. Declared outputs in subfolders exclude the whole subfolder, which would be linked otherwise
+        '''
+        valgrind = self.options["valgrind"]
+        execution = self.options["execution"]
+        paths = self._file_outputs() + [execution["stdout_file"], execution["stderr_file"], valgrind["xml_file"], valgrind["sanitizer_log"]]
+        return {os.path.normpath(path).split(os.sep)[0] for path in paths}
     
     def delete_output_files(self):
-        for output in self.options["output"]:
-            if output["type"] == "file":
-                filename = output["name"]
-                if os.path.isfile(filename):
-                    print(f"NOTE: attempting to remove output file '{filename}'", file=sys.stderr)
-                    os.remove(filename)
+        for filename in self._file_outputs():
+            if os.path.isfile(self._path(filename)):
+                print(f"NOTE: attempting to remove output file '{filename}'", file=sys.stderr)
+                os.remove(self._path(filename))
+
+    def _run_valgrind(self, stdin):
+        # the valgrind run takes place in a scratch directory so that its output files do not collide with
+        # the ones written by the regular run, which are the ones that get checked
+        with Sandbox(self.options, "valgrind_", self.cwd) as sandbox:
+            sandbox.stage(self.cwd, self._generated_files())
+            # the log is written in the sandbox, which may be the only place valgrind can write to
+            xml_file = sandbox.path("valgrind_log.xml")
+            command = f"{self.options['valgrind']['command']} --xml=yes --xml-file={xml_file} {self.exe_file}".split() + self.arguments
+            try:
+                with profiler.span("valgrind run", "execution"):
+                    result = run_process(sandbox.command(command), stdin, self.valgrind_limits, sandbox.folder)
+            finally:
+                if os.path.isfile(xml_file):
+                    shutil.move(xml_file, self.valgrind_xml_file)
+        
+        if self.options["valgrind"]["fast_summary"]:
+            valgrind_summary = ValgrindSummary()
+            with profiler.span("valgrind log summary", "execution"):
+                valgrind_summary.parse(self.valgrind_xml_file)
+            return result, valgrind_summary, None
+        return result, None, self._parse_valgrind_log(result)
+    
+    def _parse_valgrind_log(self, result):
+        valgrind_data = ValgrindData()
+        try:
+            with profiler.span("valgrind log parsing", "execution"):
+                valgrind_data.parse(self.valgrind_xml_file, self.options["valgrind"]["dedupe"], self.options["valgrind"]["max_errors"])
+        except et.ParseError:
+            # a valgrind run that has been killed leaves a truncated log behind
+            if result.timed_out or result.limit_exceeded() is not None:
+                valgrind_data = ValgrindData()
+            else:
+                raise
+        return valgrind_data
+
+    def _run_sanitizer(self, stdin):
+        valgrind = self.options["valgrind"]
+        log_file = self._path(valgrind["sanitizer_log"])
+        with Sandbox(self.options, "sanitizer_", self.cwd) as sandbox:
+            sandbox.stage(self.cwd, self._generated_files())
+            # the reports of all the sanitizers go to the log files, one per process, while anything else printed 
+            # on the standard error (e.g. errors of the sanitizer runtime itself) goes to the log directly
+            log_prefix = sandbox.path("pynta_sanitizer")
+            env = dict(os.environ)
+            env["ASAN_OPTIONS"] = f"log_path={log_prefix}:detect_leaks=1"
+            env["UBSAN_OPTIONS"] = f"log_path={log_prefix}:print_stacktrace=1"
+            
+            with profiler.span("sanitizers run", "execution"):
+                result = run_process(sandbox.command([self.sanitized_exe_file] + self.arguments), stdin, self.valgrind_limits, 
+                                     sandbox.folder, stderr_path=log_file, 
+                                     max_capture_size=int(self.options["execution"]["max_capture_size"] * 1024 * 1024),
+                                     env=env)
+            with open(log_file, "ab") as log:
+                for path in sorted(glob.glob(log_prefix + ".*")):
+                    with open(path, "rb") as f:
+                        shutil.copyfileobj(f, log)
+            
+        sanitizer_data = SanitizerData()
+        with profiler.span("sanitizers log parsing", "execution"):
+            sanitizer_data.parse(log_file, valgrind["dedupe"], valgrind["max_errors"])
+        return result, None, sanitizer_data
+
+    def _run_native(self, command, stdin, cwd):
+        execution = self.options["execution"]
+        return run_process(command, stdin, self.limits, cwd,
+                           stdout_path=self._path(execution["stdout_file"]), 
+                           stderr_path=self._path(execution["stderr_file"]), 
+                           max_capture_size=int(execution["max_capture_size"] * 1024 * 1024))
 
     def execute(self):
         stdin = self.options["execution"]["stdin"]
         
-        result = sp.run(self.command, stdout=sp.PIPE, stderr=sp.PIPE, input=stdin, text=True)
+        # valgrind is much slower than the regular run, and therefore it is launched first
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            if self.valgrind_enabled:
+                if self.backend == "sanitizer":
+                    valgrind_future = pool.submit(self._run_sanitizer, stdin)
+                else:
+                    valgrind_future = pool.submit(self._run_valgrind, stdin)
+                
+            with profiler.span("native run", "execution"):
+                if self.options["sandbox"]["enable"]:
+                    # only the declared output files make it out of the sandbox
+                    with Sandbox(self.options, "run_", self.cwd) as sandbox:
+                        sandbox.stage(self.cwd, self._generated_files())
+                        self.result = self._run_native(sandbox.command(self.command), stdin, sandbox.folder)
+                        sandbox.copy_back(self._file_outputs(), self.cwd)
+                else:
+                    self.result = self._run_native(self.command, stdin, self.cwd)
+        
+            self.return_code = self.result.return_code
+            self.stdout = self.result.stdout
+            self.stderr = self.result.stderr
         
-        self.return_code = result.returncode
-        self.stdout = result.stdout
-        self.stderr = result.stderr
+            if self.valgrind_enabled:
+                self.valgrind_result, self.valgrind_summary, self._valgrind_data = valgrind_future.result()
         
-        if self.valgrind_enabled:
-            command = f"{self.options['valgrind']['command']} --xml=yes --xml-file={self.options['valgrind']['xml_file']} {self.exe_file}".split()
-            sp.run(command, stdout=sp.PIPE, stderr=sp.PIPE, input=stdin, text=True)
-            
-            self.valgrind_data = ValgrindData()
-            self.valgrind_data.parse(self.options['valgrind']['xml_file'])
+    def _write_stream(self, stream, f):
+        with stream.open() as stream_file:
+            shutil.copyfileobj(stream_file, f)
+        if stream.truncated:
+            print(f"\n[...output truncated after {stream.size} bytes]", file=f)
+        print("", file=f)
+        
+    def _write_valgrind_summary(self, f):
+        summary = self.valgrind_summary
+        if summary.get_num_errors() == 0:
+            print(f"Valgrind found no issues", file=f)
+            return
+        
+        print(f"Valgrind reported {summary.get_num_errors()} issue(s)\n", file=f)
+        for kind, n in summary.kinds.items():
+            line = f"{kind}: {n} error(s)"
+            if summary.occurrences[kind] > n:
+                line += f" ({summary.occurrences[kind]} occurrences)"
+            if summary.leaked_bytes[kind] > 0:
+                line += f", {summary.leaked_bytes[kind]} bytes in {summary.leaked_blocks[kind]} blocks"
+            print(line, file=f)
+        if summary.suppressed > 0:
+            print(f"\nSuppressed errors: {summary.suppressed}", file=f)
+        print("\nOnly the summary of the analysis is reported, since fast_summary is enabled", file=f)
         
     def write_report(self):
-        with open(self.options["execution"]["report_path"], "w") as f:
+        with open(self._path(self.options["execution"]["report_path"]), "w") as f:
             if self.success():
                 print("--> EXECUTION SUCCESSFUL <--\n", file=f)
                 
                 print_log_section(f"STANDARD OUTPUT", f)
-                print(self.stdout, file=f)
+                self._write_stream(self.stdout, f)
                 
                 print_log_section(f"STANDARD ERROR", f)
-                print(self.stderr, file=f)
+                self._write_stream(self.stderr, f)
             else:
                 print("--> EXECUTION FAILED <--\n", file=f)
                 
                 print(f"Return code: {self.return_code}", file=f)
-                if self.return_code == -signal.SIGSEGV:
+                if self.result.timed_out:
+                    print(f"Error type: TIMEOUT (the execution took longer than {self.limits.timeout} seconds)", file=f)
+                elif self.result.limit_exceeded() is not None:
+                    print(f"Error type: LIMIT EXCEEDED ({self.result.limit_exceeded()})", file=f)
+                elif self.return_code == -signal.SIGSEGV:
                     print(f"Error type: SEGMENTATION FAULT (SIGSEGV)", file=f)
                 elif self.return_code == -signal.SIGABRT:
                     print(f"Error type: SIGABRT\n", file=f)
                     
             if self.valgrind_enabled:
-                print_log_section(f"VALGRIND ANALYSIS", f)
+                print_log_section(f"{self.backend_name.upper()} ANALYSIS", f)
+                
+                if self.valgrind_result.timed_out:
+                    print(f"TIMEOUT: the {self.backend_name.lower()} run took longer than {self.valgrind_limits.timeout} seconds, the analysis is incomplete\n", file=f)
+                elif self.valgrind_result.limit_exceeded() is not None:
+                    print(f"LIMIT EXCEEDED ({self.valgrind_result.limit_exceeded()}): the analysis is incomplete\n", file=f)
                 
-                if self.valgrind_data.get_num_errors() > 0:
-                    print("Valgrind reported the following issues\n", file=f)
+                if self.valgrind_summary is not None:
+                    self._write_valgrind_summary(f)
+                elif self.valgrind_data.get_num_errors() > 0:
+                    print(f"{self.backend_name} reported the following issues\n", file=f)
                     for kind in self.valgrind_data.list_error_kinds():
                         filtered = self.valgrind_data.filter_error_kind(kind)
                         for error in filtered.errors:
                             print(error, "\n", file=f)
+                    if len(self.valgrind_data.omitted) > 0:
+                        omitted = ", ".join(f"{n} {kind}" for kind, n in self.valgrind_data.omitted.items())
+                        print(f"Further errors have been omitted: {omitted}", file=f)
                 else:
-                    print(f"Valgrind found no issues", file=f)
+                    print(f"{self.backend_name} found no issues", file=f)
+            elif self.valgrind_skipped:
+                print_log_section(f"{self.backend_name.upper()} ANALYSIS", f)
+                print(f"SKIPPED: the executable could not be compiled with sanitizers (see the compilation report)", file=f)
                     
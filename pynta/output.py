@@ -4,9 +4,16 @@ Created on Jan 1, 2023
 @author: lorenzo
 '''
 
-import os, sys
+import os, re, sys, math, itertools
 
 from utils import print_log_section
+from reference import cache as reference_cache, parse_values
+from profiler import profiler
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class Column():
@@ -41,94 +48,399 @@ class Column():
                 print(f"Invalid max_length value '{col_options['max_length']}'", file=sys.stderr)
                 exit(1)
             
-    def check_value(self, v):
-        errors = []
-        
-        if self.casting_function != None:
-            try:
-                self.casting_function(v)
-            except ValueError:
-                errors.append(f"'{v}' cannot be cast to {self.datatype}")
-                
+        # the checks are selected once and for all so that validating a value does not need to go through the options
+        self.checks = []
+        if self.casting_function != None and self.casting_function != str:
+            self.checks.append(self._check_cast)
         if self.decimal_positions != None:
-            decimal = v.split(".")[1]
-            if len(decimal) != self.decimal_positions:
-                errors.append(f"'{v}' has the wrong number of decimal positions ({len(decimal)} instead of {self.decimal_positions})")
-                
+            self.checks.append(self._check_decimal_positions)
         if self.max_length != None:
-            if len(v) > self.max_length:
-                errors.append(f"'{v}' length exceeds max_length {self.max_length}")
+            self.checks.append(self._check_max_length)
                 
+    def pattern(self):
+        '''
+        Returns a regular expression that matches a subset of the values that pass all the checks. Values that 
+        do not match it are not necessarily invalid, but need to go through the checks one by one
+        '''
+        L = self.max_length
+        if self.datatype == "int":
+            if L is None:
+                return r"[+-]?[0-9]+"
+            elif L < 1:
+                return r"(?!)"
+            elif L == 1:
+                # there is no room for a sign
+                return r"[0-9]"
+            return r"(?:[0-9]{1,%d}|[+-][0-9]{0,%d}[0-9])" % (L, L - 2)
+        elif self.datatype == "float" and self.decimal_positions is not None:
+            dp = self.decimal_positions
+            # the integer part can be empty only if there is a decimal part, and the dot is optional otherwise
+            min_digits, fraction = (0, r"\.[0-9]{%d}" % dp) if dp > 0 else (1, r"\.?")
+            if L is None:
+                return r"[+-]?[0-9]{%d,}%s" % (min_digits, fraction)
+            elif L - dp - 2 >= min_digits:
+                return r"(?:[0-9]{%d,%d}|[+-][0-9]{%d,%d})%s" % (min_digits, L - dp - 1, min_digits, L - dp - 2, fraction)
+            # let the checks deal with these (possibly too long) values
+            return r"(?!)"
+        
+        if self.datatype == "float":
+            pattern = r"[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?"
+        else:
+            pattern = r"\S+"
+        if L is not None:
+            pattern = r"(?=\S{1,%d}(?!\S))" % L + pattern
+        return pattern + r"(?!\S)"
+                
+    def accepts(self, length, non_digits, dots, signed, decimal_positions):
+        '''
+        Vectorised counterpart of pattern(): takes numpy arrays describing a set of values (their length,
+        number of non-digit characters, number of dots, whether they start with a sign and the number of 
+        characters after the first dot) and returns a mask of the values that certainly pass all the checks
+        '''
+        digits = length - non_digits
+        if self.datatype == "int":
+            ok = (non_digits == signed) & (digits > 0)
+        elif self.datatype == "float":
+            ok = (non_digits == signed + dots) & (digits > 0) & (dots <= 1)
+            if self.decimal_positions is not None:
+                ok &= decimal_positions == self.decimal_positions
+                if self.decimal_positions > 0:
+                    ok &= dots == 1
+        else:
+            ok = np.ones(len(length), dtype=bool)
+            
+        if self.max_length is not None:
+            ok &= length <= self.max_length
+        return ok
+                
+    def _check_cast(self, v):
+        try:
+            self.casting_function(v)
+        except ValueError:
+            return f"'{v}' cannot be cast to {self.datatype}"
+        return None
+    
+    def _check_decimal_positions(self, v):
+        dot = v.find(".")
+        decimal_positions = len(v) - dot - 1 if dot != -1 else 0
+        if decimal_positions != self.decimal_positions:
+            return f"'{v}' has the wrong number of decimal positions ({decimal_positions} instead of {self.decimal_positions})"
+        return None
+    
+    def _check_max_length(self, v):
+        if len(v) > self.max_length:
+            return f"'{v}' length exceeds max_length {self.max_length}"
+        return None
+            
+    def check_value(self, v):
+        errors = []
+        for check in self.checks:
+            error = check(v)
+            if error is not None:
+                errors.append(error)
         return errors
     
     
 class Output():
 
-    def __init__(self, options):
+    def __init__(self, options, stream=None, cwd="."):
         self.options = options
         self.type = options["type"]
         self.errors = []
+        # only the first max_errors errors are stored, but all of them are counted
+        self.num_errors = 0
+        self.max_errors = options.get("max_errors", 0)
+        # path of the file containing the output to be checked, None if not available
+        self.path = None
         
         if options["type"] == "file":
             self.name = self.options["name"]
-            if not os.path.isfile(self.options["name"]):
-                self.errors.append(f"File '{self.options['name']}' not present")
+            path = os.path.join(cwd, self.options["name"])
+            if not os.path.isfile(path):
+                self._add_error(f"File '{self.options['name']}' not present")
             else:
-                with open(self.options['name'], "r") as f:
-                    self.options["output"] = f.read()
+                self.path = path
         else:
             self.name = self.type
+            if stream is not None:
+                self.path = stream.path
+                if stream.truncated:
+                    self._add_error(f"Output truncated after {stream.size} bytes, the checks have been carried out on the truncated output")
+            
+        if "columns" in self.options:
+            self.columns = [Column(col_option) for col_option in self.options["columns"]]
+            if self.options.get("engine", "python") == "numpy" and np is None:
+                print(f"NOTE: numpy is not available, falling back to the python engine to check output '{self.name}'", file=sys.stderr)
             
     def has_errors(self):
-        return len(self.errors) > 0
+        return self.num_errors > 0
+    
+    def _add_error(self, error):
+        self.num_errors += 1
+        if self.max_errors <= 0 or len(self.errors) < self.max_errors:
+            self.errors.append(error)
+    
+    def _open(self, path):
+        return open(path, "r", errors="replace")
+    
+    def _first_difference(self, other_path, chunk_size=1 << 16):
+        '''
+        Returns None if the output has the same content as the other file, or the line and column of the first 
+        character that differs otherwise
+        '''
+        line, column = 1, 1
+        with self._open(self.path) as f, self._open_reference(other_path) as other:
+            while True:
+                chunk = f.read(chunk_size)
+                other_chunk = other.read(chunk_size)
+                equal = chunk == other_chunk
+                if not equal:
+                    chunk = os.path.commonprefix([chunk, other_chunk])
+                
+                newlines = chunk.count("\n")
+                if newlines > 0:
+                    line += newlines
+                    column = len(chunk) - chunk.rfind("\n")
+                else:
+                    column += len(chunk)
+                    
+                if not equal:
+                    return line, column
+                if len(chunk) == 0:
+                    return None
+                
+    def _open_reference(self, path):
+        if reference_cache.enabled:
+            return reference_cache.get(path).open()
+        return self._open(path)
+    
+    def _numbered_lines(self, f):
+        for nl, line in enumerate(f, 1):
+            values = line.split()
+            if len(values) > 0:
+                yield nl, values
+                
+    def _numbered_reference_values(self, path):
+        if reference_cache.enabled:
+            yield from reference_cache.get(path).numbered_values()
+        else:
+            with self._open(path) as f:
+                for nl, line in enumerate(f, 1):
+                    values, numbers = parse_values(line)
+                    if len(values) > 0:
+                        yield nl, values, numbers
+                
+    def _compare_numeric(self, other_path):
+        '''
+        Compare the output with the other file value by value, with numbers being equal if they are within the 
+        given absolute or relative tolerance. Empty lines are ignored
+        '''
+        abs_tolerance = self.options.get("abs_tolerance", 0.0)
+        rel_tolerance = self.options.get("rel_tolerance", 0.0)
+        max_mismatches = self.options.get("max_mismatches", 10)
+        
+        def close(v, number):
+            if number is None:
+                return False
+            try:
+                return math.isclose(float(v), number, rel_tol=rel_tolerance, abs_tol=abs_tolerance)
+            except ValueError:
+                return False
+        
+        mismatches = 0
+        with self._open(self.path) as f:
+            for output_line, other_line in itertools.zip_longest(self._numbered_lines(f), self._numbered_reference_values(other_path)):
+                if output_line is None:
+                    self._add_error(f"The output ends before the content of the '{other_path}' file (line n. {other_line[0]})")
+                    return
+                if other_line is None:
+                    self._add_error(f"Line n. {output_line[0]}: the content of the '{other_path}' file ends before the output")
+                    return
+                
+                nl, values = output_line
+                _, other_values, other_numbers = other_line
+                if values == other_values:
+                    continue
+                
+                if len(values) != len(other_values):
+                    self._add_error(f"Line n. {nl}: {len(values)} field(s) found instead of {len(other_values)}")
+                    mismatches += 1
+                for i, (v, w, number) in enumerate(zip(values, other_values, other_numbers)):
+                    if v != w and not close(v, number):
+                        self._add_error(f"Line n. {nl}, column n. {i + 1}: '{v}' differs from the expected '{w}'")
+                        mismatches += 1
+                        
+                if max_mismatches > 0 and mismatches >= max_mismatches:
+                    # this is not an additional error and therefore is not counted as such
+                    self.errors.append(f"Comparison with the '{other_path}' file stopped after {mismatches} mismatches")
+                    return
         
     def check(self):
         # this happens when this Output is linked to a file that does not exist
-        if "output" not in self.options:
+        if self.path is None:
             return
         
         if "empty" in self.options:
+            size = os.path.getsize(self.path)
             if self.options["empty"]:
-                if len(self.options["output"]) > 0:
-                    self.errors.append(f"Not empty as it should be")
+                if size > 0:
+                    self._add_error(f"Not empty as it should be")
             else:
-                if len(self.options["output"]) == 0:
-                    self.errors.append(f"The output is empty")
+                if size == 0:
+                    self._add_error(f"The output is empty")
                 
         if "equal_to" in self.options:
             if not os.path.isfile(self.options["equal_to"]):
-                self.errors.append(f"'equal_to' file '{self.options['equal_to']}' not found")
+                self._add_error(f"'equal_to' file '{self.options['equal_to']}' not found")
+            elif "abs_tolerance" in self.options or "rel_tolerance" in self.options:
+                self._compare_numeric(self.options["equal_to"])
             else:
-                with open(self.options['equal_to'])  as f:
-                    equal_to_content = f.read()
-                    
-                if self.options["output"] != equal_to_content:
-                    self.errors.append(f"Not equal to the content of the '{self.options['equal_to']}' file")
+                difference = self._first_difference(self.options["equal_to"])
+                if difference is not None:
+                    self._add_error(f"Not equal to the content of the '{self.options['equal_to']}' file (first difference at line n. {difference[0]}, column n. {difference[1]})")
                     
         if "columns" in self.options:
-            columns = [Column(col_option) for col_option in self.options["columns"]]
-            for nl, line in enumerate(self.options["output"].split("\n")):
-                spl = line.split()
-                if len(spl) > 0:
-                    if len(spl) != len(columns):
-                        self.errors.append(f"Line n. {nl + 1}: {len(spl)} field(s) found instead of {len(columns)}")
-                        
-                    for i, v in enumerate(spl):
-                        for error in columns[i].check_value(v):
-                            self.errors.append(f"Line n. {nl + 1}, column n. {i + 1}: {error}")
+            if self.options.get("engine", "python") == "numpy" and np is not None:
+                self._check_columns_numpy()
+            else:
+                self._check_columns()
+            
+    def _check_line(self, nl, line):
+        spl = line.split()
+        if len(spl) == 0:
+            return
+        
+        if len(spl) != len(self.columns):
+            self._add_error(f"Line n. {nl}: {len(spl)} field(s) found instead of {len(self.columns)}")
+            
+        for i, (v, column) in enumerate(zip(spl, self.columns)):
+            for check in column.checks:
+                error = check(v)
+                if error is not None:
+                    self._add_error(f"Line n. {nl}, column n. {i + 1}: {error}")
+            
+    def _check_columns_numpy(self, chunk_size=1 << 22):
+        '''
+        Same as _check_columns, but the lines that certainly pass all the checks are found by processing
+        each chunk as a whole with numpy. Only the positions of the values, of the newlines and of the 
+        non-digit characters are extracted from the raw bytes, so that the rest of the analysis works on 
+        per-value arrays
+        '''
+        N_columns = len(self.columns)
+        
+        nl = 1
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if len(chunk) == 0:
+                    break
+                chunk += f.readline()
+                # same newline translation carried out by the python engine
+                if b"\r" in chunk:
+                    chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+                if chunk[-1:] != b"\n":
+                    chunk += b"\n"
+                    
+                buf = np.frombuffer(chunk, dtype=np.uint8)
+                newlines = np.flatnonzero(buf == ord("\n"))
+                N_lines = len(newlines)
+                line_starts = np.concatenate(([0], newlines[:-1] + 1))
+                
+                # values are the runs of characters > ' ', and since the chunk ends with a newline
+                # boundaries alternate between starts and ends
+                is_space = buf <= ord(" ")
+                boundaries = np.flatnonzero(is_space[1:] != is_space[:-1]) + 1
+                if not is_space[0]:
+                    boundaries = np.concatenate(([0], boundaries))
+                starts = boundaries[0::2]
+                ends = boundaries[1::2]
+                N_values = len(starts)
+                
+                fields = np.diff(np.searchsorted(starts, newlines), prepend=0)
+                bad_lines = (fields != N_columns) & (fields != 0)
+                
+                # control and non-ascii characters may or may not be whitespace according to str.split(), 
+                # and lines containing them are left to the python engine
+                weird = np.flatnonzero((buf >= 128) | (buf < ord("\t")) | ((buf > ord("\r")) & (buf < 0x1c)))
+                bad_lines[np.searchsorted(newlines, weird)] = True
+                
+                # map each non-digit character to the value it belongs to
+                special = np.flatnonzero((buf > ord("9")) | ((buf < ord("0")) & ~is_space))
+                value = np.searchsorted(starts, special, side="right") - 1
+                is_dot = buf[special] == ord(".")
+                non_digits = np.bincount(value, minlength=N_values)
+                dots = np.bincount(value[is_dot], minlength=N_values)
+                # only meaningful for values containing exactly one dot, which are the only ones that can be accepted
+                decimal_positions = np.zeros(N_values, dtype=np.int64)
+                decimal_positions[value[is_dot]] = ends[value[is_dot]] - special[is_dot] - 1
+                length = ends - starts
+                first = buf[starts]
+                signed = ((first == ord("+")) | (first == ord("-"))).astype(np.int64)
+                
+                # the values of lines with the right number of fields form a (lines x columns) table
+                good_lines = fields == N_columns
+                if bad_lines.any():
+                    in_good_line = np.repeat(good_lines, fields)
+                    select = lambda a: a[in_good_line].reshape(-1, N_columns)
+                else:
+                    select = lambda a: a.reshape(-1, N_columns)
+                length, non_digits, dots, signed, decimal_positions = map(select, [length, non_digits, dots, signed, decimal_positions])
+                
+                ok = np.ones(len(length), dtype=bool)
+                for i, column in enumerate(self.columns):
+                    ok &= column.accepts(length[:, i], non_digits[:, i], dots[:, i], signed[:, i], decimal_positions[:, i])
+                bad_lines[np.flatnonzero(good_lines)[~ok]] = True
+                    
+                for i in np.flatnonzero(bad_lines):
+                    text = chunk[line_starts[i]:newlines[i] + 1].decode(errors="replace")
+                    self._check_line(nl + int(i), text)
+                nl += N_lines
+
+    def _check_columns(self, chunk_size=1 << 20):
+        '''
+        The file is processed in chunks made of whole lines. Each chunk is scanned with a regular expression
+        that skips over runs of lines that are certainly valid, and only the remaining lines are checked one 
+        value at a time
+        '''
+        row = r"[ \t]*" + r"[ \t]+".join(column.pattern() for column in self.columns)
+        valid_lines = re.compile(r"(?:%s[ \t]*\n)*" % row)
+        
+        nl = 1
+        with self._open(self.path) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if len(chunk) == 0:
+                    break
+                chunk += f.readline()
+                if chunk[-1] != "\n":
+                    chunk += "\n"
+                    
+                pos = 0
+                while pos < len(chunk):
+                    end = valid_lines.match(chunk, pos).end()
+                    nl += chunk.count("\n", pos, end)
+                    if end == len(chunk):
+                        break
+                    
+                    line_end = chunk.index("\n", end) + 1
+                    self._check_line(nl, chunk[end:line_end])
+                    nl += 1
+                    pos = line_end
             
 class CheckOutput():
 
-    def __init__(self, options, stdout, stderr):
+    def __init__(self, options, stdout, stderr, cwd="."):
         self.options = options
+        # the folder output files and the report are relative to
+        self.cwd = cwd
         self.outputs = []
         for output in options["output"]:
             if output["type"] == "stdout":
-                output["output"] = stdout
+                self.outputs.append(Output(output, stdout))
             elif output["type"] == "stderr":
-                output["output"] = stderr
-            
-            self.outputs.append(Output(output))
+                self.outputs.append(Output(output, stderr))
+            else:
+                self.outputs.append(Output(output, cwd=cwd))
         
         self.check()
         
@@ -138,24 +450,39 @@ class CheckOutput():
         for output in self.outputs:
             line = f"Output {output.name}: "
             if output.has_errors():
-                line += f"FAILED ({len(output.errors)} error(s))"
+                line += f"FAILED ({output.num_errors} error(s))"
             else:
                 line += "OK"
             lines.append(line)
             
         return "\n".join(lines)
     
+    def to_dict(self):
+        outputs = []
+        for output in self.outputs:
+            outputs.append({
+                "name" : output.name,
+                "type" : output.type,
+                "ok" : not output.has_errors(),
+                "num_errors" : output.num_errors,
+                "errors" : output.errors
+            })
+        return {"outputs" : outputs}
+    
     def write_report(self):
-        with open(self.options["output_report_path"], "w") as f:
+        with open(os.path.join(self.cwd, self.options["output_report_path"]), "w") as f:
             for output in self.outputs:
                 print_log_section(f"OUTPUT {output.name}", f)
                 
                 if output.has_errors():
                     for error in output.errors:
                         print(error, file=f)
+                    if output.num_errors > len(output.errors):
+                        print(f"[...and {output.num_errors - len(output.errors)} more error(s)]", file=f)
                 else:
                     print("OK", file=f)
         
     def check(self):
         for output in self.outputs:
-            output.check()
+            with profiler.span(f"check {output.name}", "output"):
+                output.check()
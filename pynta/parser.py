@@ -7,17 +7,210 @@ Created on Dec 30, 2024
 import os, re
 from utils import print_log_section
 
+# the parts of C code whose content should never be interpreted: comments, string and char literals and preprocessor directives
+_COMMENT = r'//[^\n]*|/\*.*?(?:\*/|\Z)'
+_LITERAL = r'"(?:[^"\\\n]|\\.)*"?|\'(?:[^\'\\\n]|\\.)*\'?'
+_DIRECTIVE = r'\#(?:\\\n|[^\n])*'
+
+# each alternative starts with a literal character, which lets the regex engine skip quickly over everything else
+RE_CLEAN = re.compile(f'{_COMMENT}|{_LITERAL}|\t[ \t]*| [ \t]+', re.DOTALL)
+# runs of identifiers and stars (e.g. "static const char *name") are matched as a single token
+RE_TOKEN = re.compile(f'\\s+|(?P<skip>{_COMMENT}|{_DIRECTIVE}|{_LITERAL})|(?P<words>[A-Za-z_*][\\w\\s*]*)|(?P<other>\\d\\w*|.)', re.DOTALL)
+RE_PARENTHESES = re.compile(f'{_COMMENT}|{_DIRECTIVE}|{_LITERAL}|\\(|\\)|;|\\{{|\\}}', re.DOTALL)
+RE_BRACES = re.compile(f'{_COMMENT}|{_DIRECTIVE}|{_LITERAL}|\\{{|\\}}', re.DOTALL)
+RE_BODY = re.compile(r'\s*\{')
+
+KEYWORDS = {"if", "else", "for", "while", "do", "switch", "return", "sizeof"}
+# specifiers that are not part of the return type of a function
+STORAGE_SPECIFIERS = {"static", "extern", "inline"}
+
+
+def _clean_match(m):
+    token = m.group()
+    if token[0] == "/":
+        # as far as the compiler is concerned, a multi-line comment is a space
+        return "" if token[1] == "/" else " "
+    if token[0] == '"' or token[0] == "'":
+        return token
+    return " "
+
+
+def clean_source(source):
+    '''
+    Clean C code in a single pass by removing comments and replacing each sequence of spaces and tabs with 
+    a single space. String and char literals are left untouched
+    '''
+    return RE_CLEAN.sub(_clean_match, source)
+
+
+def _skip_braces(source, pos):
+    '''
+    Returns the position right after the brace that closes the one found just before pos, or the length of
+    source if there is no such brace
+    '''
+    depth = 1
+    for m in RE_BRACES.finditer(source, pos):
+        c = m.group()
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return m.end()
+    return len(source)
+
+
+def _skip_parentheses(source, pos):
+    '''
+    Returns the position right after the parenthesis that closes the one found just before pos, and True. 
+    Since semicolons and braces cannot appear in argument lists, if one of them comes first the parentheses 
+    are unbalanced, and its position is returned together with False
+    '''
+    depth = 1
+    for m in RE_PARENTHESES.finditer(source, pos):
+        c = m.group()
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return m.end(), True
+        elif c in ";{}":
+            return m.start(), False
+    return len(source), False
+
+
+def _split_arguments(args):
+    '''
+    Split the arguments on the commas that are not nested in parentheses (e.g. in function pointer arguments)
+    '''
+    if "(" not in args:
+        return args.split(",")
+    
+    arguments = []
+    depth = 0
+    start = 0
+    for m in re.finditer(r'[(),]', args):
+        c = m.group()
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif depth == 0:
+            arguments.append(args[start:m.start()])
+            start = m.end()
+    arguments.append(args[start:])
+    return arguments
+
+
+def _parse_function_argument(arg):
+    arg = " ".join(arg.split())
+    if "(" in arg:
+        # function pointers: "int (*f)(int a, int b)" becomes "int(*)(int,int)"
+        m = re.match(r'(.*?)\(\s*\*\s*\w*\s*\)\s*\((.*)\)$', arg)
+        if m:
+            args = ",".join(_parse_function_argument(a) for a in _split_arguments(m.group(2)))
+            return f"{m.group(1).strip().replace(' *', '*')}(*)({args})"
+        
+    last_star = arg.rfind("*")
+    if last_star != -1:
+        arg = arg[0:last_star + 1]
+        spl_arg = arg.split()
+        arg = " ".join(spl_arg[0:-1]) + spl_arg[-1] # turns "type *" into "type*" to enforce consistency
+    else:
+        arg = arg.rsplit(" ", 1)[0].strip()
+
+    return arg
+
+
+def extract_functions(source):
+    '''
+    Find the definitions of all the functions in the source and return a dictionary mapping their names to
+    their return and argument types. The source is scanned only once, since the bodies of functions (and of
+    anything else enclosed in braces) are skipped over
+    '''
+    functions = {}
+    # identifiers and stars found since the end of the last declaration or definition
+    words = []
+    pos = 0
+    while pos < len(source):
+        m = RE_TOKEN.match(source, pos)
+        pos = m.end()
+        if m.lastgroup is None or m.lastgroup == "skip":
+            continue
+
+        token = m.group()
+        if m.lastgroup == "words":
+            words += token.replace("*", " * ").split()
+            continue
+        
+        if token == "(" and len(words) > 1 and words[-1] != "*" and words[-1] not in KEYWORDS:
+            end, closed = _skip_parentheses(source, pos)
+            body = RE_BODY.match(source, end) if closed else None
+            if body is not None:
+                name = words[-1]
+                return_type = " ".join(w for w in words[0:-1] if w not in STORAGE_SPECIFIERS)
+                args = source[pos:end - 1].strip()
+                functions[name] = {
+                    'return_type': return_type.replace(" *", "*"),
+                    'arg_types': [_parse_function_argument(arg) for arg in _split_arguments(args)] if args else []
+                }
+                end = _skip_braces(source, body.end())
+            pos = end
+        elif token == "{":
+            pos = _skip_braces(source, pos)
+        
+        words = []
+
+    return functions
+
+
+RE_AUX_INFO = re.compile(r'^/\* (?P<file>.*):\d+:(?:\d+:)?(?P<style>[NO])(?P<kind>[CF]) \*/ (?P<return_type>.*?)(?P<name>\w+) \((?P<args>.*?)\);')
+
+
+def parse_aux_info(aux_info, source_file):
+    '''
+    Extract the return and argument types of the functions defined in source_file from the prototypes written by
+    gcc's -aux-info option, which look like
+
+    /* mycode.c:5:NF */ extern double *make (int n); /* (n) int n; */
+
+    where F stands for definition (and C for declaration), and N for new-style (and O for old-style, K&R) definitions
+    '''
+    functions = {}
+    for line in aux_info.splitlines():
+        m = RE_AUX_INFO.match(line)
+        if m is None or m.group("kind") != "F" or os.path.abspath(m.group("file")) != source_file:
+            continue
+
+        return_type = " ".join(w for w in m.group("return_type").split() if w not in STORAGE_SPECIFIERS)
+        args = m.group("args").strip()
+        # gcc turns empty argument lists of old-style definitions (e.g. "int main()") into (void)
+        if m.group("style") == "O" and args == "void":
+            args = ""
+        functions[m.group("name")] = {
+            'return_type': return_type.replace(" *", "*"),
+            'arg_types': [_parse_function_argument(arg) for arg in _split_arguments(args)] if args else []
+        }
+
+    return functions
+
+
 class Parser:
-    def __init__(self, options):
+    def __init__(self, options, compiler=None):
         self.options = options
 
         self.source_file = options["filename"]
         if not os.path.isfile(self.source_file):
             raise Exception(f"Source file '{self.source_file}' does not exist or it is not accessible")
 
-        self._source = open(self.source_file, "r").read()
-        self._clean_source()
-        self._functions = self._extract_functions()
+        # the signatures written by the compiler are used if available, otherwise we fall back to scanning the source
+        if compiler is not None and compiler.aux_info is not None:
+            self._functions = parse_aux_info(compiler.aux_info, self.source_file)
+        else:
+            with open(self.source_file, "r") as f:
+                self._source = clean_source(f.read())
+            self._functions = extract_functions(self._source)
         self.errors = []
 
         for user_function in self.options["parsing"]["functions"]:
@@ -44,66 +237,14 @@ class Parser:
         else:
             return f"Parsing: FAILED ({N_errors} error(s))"
 
+    def to_dict(self):
+        return {
+            "ok" : len(self.errors) == 0,
+            "functions" : self._functions,
+            "errors" : self.errors
+        }
+
     def write_report(self):
         with open(self.options["parsing"]["report_path"], "w") as f:
             for e in self.errors:
                 print(e, file=f)
-
-    def _clean_source(self):
-        """
-        Clean C code by:
-        - Replacing tabs with spaces
-        - Replacing multiple spaces with a single space
-        - Removing comments (both single-line and multi-line)
-        """
-        # remove single-line comments
-        self._source = re.sub(r'//.*', '', self._source)
-        # remove multi-line comments
-        self._source = re.sub(r'/\*.*?\*/', '', self._source, flags=re.DOTALL)
-        # replace tabs with spaces
-        self._source = self._source.replace('\t', ' ')
-        # replace multiple spaces with a single space
-        self._source = re.sub(r' +', ' ', self._source)
-
-    def _parse_function_argument(self, arg):
-        arg = arg.strip()
-        last_star = arg.rfind("*")
-        if last_star != -1:
-            arg = arg[0:last_star + 1]
-            spl_arg = arg.split()
-            arg = " ".join(spl_arg[0:-1]) + spl_arg[-1] # turns "type *" into "type*" to enforce consistency
-        else:
-            arg = arg.rsplit(" ", 1)[0].strip()
-
-        return arg
-
-    def _extract_functions(self):
-        # regular expression to match C function signatures
-        function_pattern = re.compile(
-            r'(?P<return_type>[a-zA-Z_][a-zA-Z0-9_\s\*]*)\s+'   # Return type
-            r'(?P<name>[a-zA-Z_][a-zA-Z0-9_]*)\s*'              # Function name
-            r'\((?P<args>[^\)]*)\)\s*\{'                        # Arguments inside parentheses
-        )
-
-        functions = {}
-
-        for match in function_pattern.finditer(self._source):
-            return_type = match.group('return_type').strip()
-            name = match.group('name').strip()
-            args = match.group('args').strip()
-
-            # split and clean argument types
-            arg_types = []
-            if args:
-                for arg in args.split(","):
-                    arg_types.append(self._parse_function_argument(arg))
-            else:
-                arg_types = []
-
-            functions[name] = {
-                'return_type': return_type,
-                'arg_types': arg_types
-            }
-
-        return functions
-    
\ No newline at end of file
@@ -0,0 +1,137 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import os, json, time, resource, threading
+
+
+def rusage_to_dict(rusage):
+    return {
+        "user_time" : rusage.ru_utime,
+        "system_time" : rusage.ru_stime,
+        "max_rss" : rusage.ru_maxrss # in kB
+    }
+
+
+def _children_cpu_time():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return children.ru_utime + children.ru_stime
+
+
+@dataclass
+class Event:
+    '''
+    A timed section of the analysis (a stage or one of its steps) or a child process. Times are in seconds
+    '''
+    name: str
+    category: str
+    start: float
+    wall_time: float = 0.
+    # CPU time spent by pynta itself and by the child processes it has waited for. These are process-wide counters,
+    # and therefore they also include the work carried out by other threads during the event (e.g. the valgrind run,
+    # which overlaps with the native run)
+    cpu_time: float = 0.
+    children_cpu_time: float = 0.
+    pid: int = field(default_factory=os.getpid)
+    tid: int = field(default_factory=threading.get_ident)
+    args: dict = field(default_factory=dict)
+
+    def timing(self):
+        return {
+            "wall_time" : self.wall_time,
+            "cpu_time" : self.cpu_time,
+            "children_cpu_time" : self.children_cpu_time
+        }
+
+    def to_chrome(self):
+        '''
+        The event in the Trace Event Format understood by chrome://tracing and Perfetto
+        '''
+        args = dict(self.args)
+        if self.category != "process":
+            args.update(self.timing())
+        return {
+            "name" : self.name,
+            "cat" : self.category,
+            "ph" : "X",
+            "ts" : self.start * 1e6,
+            "dur" : self.wall_time * 1e6,
+            "pid" : self.pid,
+            "tid" : self.tid,
+            "args" : args
+        }
+
+
+class Profiler:
+    '''
+    Collects the timings of the stages of the analysis and the resource usage of the child processes. Events are always
+    measured (which is cheap), but they are stored and passed to the hooks only if the profiler is enabled
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        # callables invoked with each Event as soon as it is complete
+        self.hooks = []
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def reset(self):
+        self.events = []
+
+    def _record(self, event):
+        if not self.enabled:
+            return
+        self.events.append(event)
+        for hook in self.hooks:
+            hook(event)
+
+    @contextmanager
+    def span(self, name, category="stage", **args):
+        event = Event(name, category, time.perf_counter(), args=args)
+        cpu_time, children_cpu_time = time.process_time(), _children_cpu_time()
+        try:
+            yield event
+        finally:
+            event.wall_time = time.perf_counter() - event.start
+            event.cpu_time = time.process_time() - cpu_time
+            event.children_cpu_time = _children_cpu_time() - children_cpu_time
+            self._record(event)
+
+    def record_process(self, command, start, rusage):
+        '''
+        Record a child process that has been started at time start (as given by time.perf_counter()) and
+        that has just been reaped, together with the resource usage returned by os.wait4
+        '''
+        if not self.enabled:
+            return
+        event = Event(os.path.basename(command[0]), "process", start, time.perf_counter() - start)
+        event.cpu_time = rusage.ru_utime + rusage.ru_stime
+        event.args = rusage_to_dict(rusage)
+        event.args["command"] = " ".join(command)
+        self._record(event)
+
+    def to_chrome_trace(self):
+        return {"traceEvents" : [event.to_chrome() for event in self.events], "displayTimeUnit" : "ms"}
+
+    def write_chrome_trace(self, path, events=None):
+        '''
+        Write the given events (already converted with Event.to_chrome) or the ones collected so far to a trace
+        file that can be loaded in chrome://tracing or Perfetto
+        '''
+        if events is None:
+            trace = self.to_chrome_trace()
+        else:
+            trace = {"traceEvents" : events, "displayTimeUnit" : "ms"}
+        data = json.dumps(trace)
+        with open(path, "w") as f:
+            f.write(data)
+
+
+# shared by all the stages of the analyses carried out by the current process
+profiler = Profiler()
@@ -4,18 +4,209 @@ Created on Dec 25, 2022
 @author: lorenzo
 '''
 
-import sys, os
+import sys, os, copy, json
 import tomli
 
 from parser import Parser
-from compiler import Compiler
+from compiler import Compiler, compiler_version
 from launcher import Launcher
 from output import CheckOutput
+from cases import Cases
+from profiler import profiler
+from incremental import StageState, digest, file_digest, file_signature
 
 
 class Analyser:
-    def __init__(self):
-        pass
+    def __init__(self, options):
+        self.options = options
+        
+        self.parser = None
+        self.compiler = None
+        self.launcher = None
+        self.check_output = None
+        # used instead of launcher and check_output if [[execution.cases]] are given
+        self.cases = None
+        self.summaries = []
+        self.error = None
+        # wall-clock and CPU times of each stage, in seconds
+        self.timings = {}
+        # the events collected by the profiler during the analysis, if profiling is enabled
+        self.events = []
+        # the results of the previous analysis, if incremental is enabled
+        self.state = None
+        self.fingerprints = {}
+        # the stages that have been taken from the previous analysis
+        self.cached = set()
+        
+    def _log(self, summary, out):
+        self.summaries.append(summary)
+        if out is not None:
+            print(summary, file=out)
+        
+    def _timed(self, stage, function):
+        with profiler.span(stage) as event:
+            result = function()
+        self.timings[stage] = event.timing()
+        return result
+    
+    def _write_report(self, stage):
+        if self.options["report_format"] == "text":
+            stage.write_report()
+        
+    def run(self, out=None):
+        profiling = self.options["profiling"]
+        # the profiler is shared by the whole process, which may carry out many analyses (e.g. a daemon worker), and
+        # therefore it is scoped to this analysis only
+        profiler.enabled = profiling["enable"]
+        profiler.reset()
+            
+        try:
+            self._run(out)
+        except Exception as e:
+            self.error = str(e)
+            raise
+        finally:
+            if self.options["report_format"] == "json":
+                self.write_json_report()
+            if profiling["enable"] and profiling["trace_file"] != "":
+                profiler.write_chrome_trace(profiling["trace_file"])
+            self.events = profiler.events
+            profiler.enabled = False
+            profiler.reset()
+        
+    def _fingerprint(self, stage):
+        '''
+        The fingerprint of the inputs of the given stage, which can be computed only after the stages it depends on
+        '''
+        options = self.options
+        if stage == "compilation":
+            valgrind = options["valgrind"]
+            fingerprint = digest(self.source_digest, options["filename"], os.getcwd(), options["compilation"], options["parsing"]["backend"],
+                                 [valgrind["enable"], valgrind["backend"], valgrind["sanitizer_flags"]],
+                                 compiler_version(options["compilation"]["command"].split()[0]))
+        elif stage == "parsing":
+            aux_info = self.compiler.aux_info if self.compiler is not None else None
+            fingerprint = digest(self.source_digest, options["parsing"], aux_info)
+        elif stage == "execution":
+            # the runs only need the names of the output files, which they delete beforehand and copy out of the
+            # sandbox afterwards, while the rest of the outputs is only used by the output checks
+            def output_files(outputs):
+                return [output["name"] for output in outputs if output["type"] == "file"]
+            execution = dict(options["execution"])
+            execution["cases"] = [({key : value for key, value in case.items() if key != "output"}, output_files(case.get("output", []))) 
+                                  for case in execution["cases"]]
+            fingerprint = digest([file_digest(path) for path in self.compiler.artifacts()], execution, options["valgrind"], 
+                                 options["sandbox"], output_files(options.get("output", [])))
+        else:
+            execution = self.launcher if self.cases is None else self.cases
+            references = [file_signature(output["equal_to"]) for output in options.outputs() if "equal_to" in output]
+            fingerprint = digest(self.fingerprints["execution"], options.outputs(), 
+                                 [file_signature(path) for path in execution.artifacts()], references)
+        self.fingerprints[stage] = fingerprint
+        return fingerprint
+    
+    def _stage(self, name, function, artifacts=False):
+        '''
+        Build the given stage by calling function, unless the previous analysis has built it from the same inputs.
+        If artifacts is True, the stage is reused only if the files it has produced have not been touched
+        '''
+        if self.state is None:
+            return self._timed(name, function)
+        
+        fingerprint = self._fingerprint(name)
+        stage = self._timed(name, lambda: self.state.load(name, fingerprint))
+        if stage is not None:
+            stage.options = self.options
+            self.cached.add(name)
+            return stage
+        
+        stage = self._timed(name, function)
+        self.state.store(name, fingerprint, stage, stage.artifacts() if artifacts else [])
+        return stage
+    
+    def _check_cases(self):
+        '''
+        The outputs of the cases are checked together with their execution, and therefore they have to be checked
+        again only if the cases come from the previous analysis and the outputs have changed since
+        '''
+        if self.state is None:
+            return
+        
+        fingerprint = self._fingerprint("output")
+        checks = None
+        if "execution" in self.cached:
+            checks = self._timed("output", lambda: self.state.load("output", fingerprint))
+        
+        if checks is not None:
+            for case, check_output in zip(self.cases.cases, checks):
+                case.check_output = check_output
+                check_output.options = case.options
+            self.cached.add("output")
+        else:
+            if "execution" in self.cached:
+                self._timed("output", lambda: self.cases.check(self.options))
+            self.state.store("output", fingerprint, [case.check_output for case in self.cases.cases])
+        
+    def _run(self, out):
+        incremental = self.options["incremental"]
+        if incremental["enable"]:
+            self.state = StageState(incremental["state_dir"])
+            self.source_digest = file_digest(self.options["filename"])
+        
+        # the compiler backend of the parser uses the output of the compilation, which should therefore come first
+        if self.options["parsing"]["backend"] == "compiler":
+            self.compiler = self._stage("compilation", lambda: Compiler(self.options), artifacts=True)
+            
+        self.parser = self._stage("parsing", lambda: Parser(self.options, self.compiler))
+        self._write_report(self.parser)
+        self._log(self.parser.summary(), out)
+
+        if self.compiler is None:
+            self.compiler = self._stage("compilation", lambda: Compiler(self.options), artifacts=True)
+        self._write_report(self.compiler)
+        self._log(self.compiler.summary(), out)
+        
+        if self.compiler.compiled():
+            sanitized_exe_file = self.compiler.sanitized_exe_file if self.compiler.sanitized() else None
+            if len(self.options["execution"]["cases"]) > 0:
+                self.cases = self._stage("execution", lambda: Cases(self.options, self.compiler.exe_file, sanitized_exe_file), artifacts=True)
+                self._check_cases()
+                self._write_report(self.cases)
+                self._log(self.cases.summary(), out)
+                return
+            
+            self.launcher = self._stage("execution", lambda: Launcher(self.options, self.compiler.exe_file, sanitized_exe_file), artifacts=True)
+            self._write_report(self.launcher)
+            self._log(self.launcher.summary(), out)
+            
+            self.check_output = self._stage("output", lambda: CheckOutput(self.options, self.launcher.stdout, self.launcher.stderr))
+            self._write_report(self.check_output)
+            self._log(self.check_output.summary(), out)
+            
+    def summary(self):
+        return "\n".join(self.summaries)
+    
+    def to_dict(self):
+        stages = {}
+        execution = self.launcher if self.cases is None else self.cases
+        for name, stage in [("parsing", self.parser), ("compilation", self.compiler), ("execution", execution), ("output", self.check_output)]:
+            if stage is not None:
+                stages[name] = stage.to_dict()
+                stages[name]["timing"] = self.timings[name]
+                stages[name]["cached"] = name in self.cached
+        
+        return {
+            "filename" : self.options["filename"],
+            "error" : self.error,
+            "summary" : self.summaries,
+            "stages" : stages
+        }
+    
+    def write_json_report(self):
+        # the document is serialised in memory and then written with a single call
+        report = json.dumps(self.to_dict(), indent=4)
+        with open(self.options["json_report_path"], "w") as f:
+            f.write(report)
 
 
 class Input(dict):
@@ -24,6 +215,7 @@ class Input(dict):
     defaults = {
         "parsing" : {
             "report_path" : "parsing_report.txt",
+            "backend" : "regex",
             "functions" : []
         },
         "compilation" : {
@@ -31,26 +223,90 @@ class Input(dict):
             "command_post" : "",
             "all_warnings" : True,
             "all_warnings_command" : "gcc -Wall",
-            "report_path" : "compilation_report.txt"
+            "single_invocation" : False,
+            "diagnostics_format" : "text",
+            "report_path" : "compilation_report.txt",
+            "cache" : False,
+            "cache_dir" : "~/.cache/pynta",
+            "cache_max_size" : 512
         },
         "execution" : {
             "arguments" : "",
             "stdin" : None,
             "report_path" : "execution_report.txt",
-            "expected_return_code" : 0
+            "expected_return_code" : 0,
+            "stdout_file" : "stdout.txt",
+            "stderr_file" : "stderr.txt",
+            "max_capture_size" : 10,
+            "timeout" : 0,
+            "cpu_time" : 0,
+            "memory" : 0,
+            "output_size" : 0,
+            "processes" : 0,
+            "cases" : [],
+            "max_parallel_cases" : 0
         },
         "valgrind" : {
             "enable" : True,
             "command" : "valgrind --leak-check=full --show-leak-kinds=all",
-            "xml_file" : "valgrind_log.xml"
+            "xml_file" : "valgrind_log.xml",
+            "dedupe" : False,
+            "max_errors" : 0,
+            "fast_summary" : False,
+            "backend" : "valgrind",
+            "sanitizer_flags" : "-fsanitize=address,undefined -fno-omit-frame-pointer",
+            "sanitizer_log" : "sanitizer_log.txt",
+            "timeout" : 0,
+            "cpu_time" : 0,
+            "memory" : 0,
+            "output_size" : 0,
+            "processes" : 0
+        },
+        "sandbox" : {
+            "enable" : False,
+            "scratch_root" : "/dev/shm",
+            "namespaces" : True
+        },
+        "incremental" : {
+            "enable" : False,
+            "state_dir" : ".pynta_state"
+        },
+        "profiling" : {
+            "enable" : False,
+            "trace_file" : "trace.json"
+        },
+        "batch" : {
+            "processes" : 0,
+            "report_path" : "batch_report.txt",
+            "json_report_path" : "batch_report.ndjson",
+            "cache_references" : True
+        },
+        "similarity" : {
+            "enable" : False,
+            "k" : 12,
+            "winnow_window" : 8,
+            "num_hashes" : 64,
+            "bands" : 32,
+            "min_similarity" : 0.2,
+            "max_frequency" : 0.2,
+            "frequency_min_submissions" : 20,
+            "top_pairs" : 50,
+            "max_regions" : 10,
+            "base_files" : [],
+            "archive_indices" : [],
+            "index_path" : "",
+            "report_path" : "similarity_report.txt",
+            "json_report_path" : "similarity_report.json"
         },
         "output_report_path" : "output_report.txt",
+        "report_format" : "text",
+        "json_report_path" : "report.json",
         "working_dir" : "."
         
     }
     
     def __init__(self, input_file):
-        self.update(Input.defaults)
+        self.update(copy.deepcopy(Input.defaults))
         
         self.input_file = input_file
         
@@ -62,9 +318,10 @@ class Input(dict):
                 exit(1)
             
         self.recursive_merge(self, options) # in this way defaults that are not present in the config file are not overwritten
-        self["filename"] = os.path.abspath(self["filename"])
         
         self._check()
+        if "filename" in self:
+            self["filename"] = os.path.abspath(self["filename"])
 
     @staticmethod
     def recursive_merge(base, incoming):
@@ -79,13 +336,47 @@ class Input(dict):
                 # Overwrite or set the value
                 base[key] = value
         
+    def outputs(self):
+        '''
+        All the outputs, including the ones of the single cases
+        '''
+        outputs = list(self.get("output", []))
+        for case in self["execution"]["cases"]:
+            outputs += case.get("output", [])
+        return outputs
+        
     def _check(self):
-        for key in Input.required:
+        for key in self.required:
             if key not in self:
                 print(f"Required key '{key}' not found in '{self.input_file}'", file=sys.stderr)
                 exit(1)
                 
-        for output in self["output"]:
+        if self["parsing"]["backend"] not in ["regex", "compiler"]:
+            print(f"Invalid parsing backend '{self['parsing']['backend']}'", file=sys.stderr)
+            exit(1)
+            
+        if self["valgrind"]["backend"] not in ["valgrind", "sanitizer"]:
+            print(f"Invalid valgrind backend '{self['valgrind']['backend']}'", file=sys.stderr)
+            exit(1)
+            
+        if self["report_format"] not in ["text", "json"]:
+            print(f"Invalid report format '{self['report_format']}'", file=sys.stderr)
+            exit(1)
+                
+        similarity = self["similarity"]
+        if similarity["k"] < 1 or similarity["winnow_window"] < 1 or similarity["bands"] < 1 or similarity["num_hashes"] % similarity["bands"] != 0:
+            print("The similarity options k and winnow_window should be positive, and num_hashes should be a multiple of bands", file=sys.stderr)
+            exit(1)
+            
+        names = set()
+        for case in self["execution"]["cases"]:
+            name = str(case.get("name", len(names) + 1))
+            if name in names or os.sep in name:
+                print(f"Invalid or duplicate case name '{name}'", file=sys.stderr)
+                exit(1)
+            names.add(name)
+                
+        for output in self.outputs():
             if output["type"] not in ["stdout", "stderr", "file"]:
                 print(f"Invalid output type '{output['type']}'", file=sys.stderr)
                 exit(1)
@@ -109,22 +400,8 @@ if __name__ == '__main__':
     os.chdir(options["working_dir"])
     
     try:
-        parser = Parser(options)
-        parser.write_report()
-        print(parser.summary())
-
-        compiler = Compiler(options)
-        compiler.write_report()
-        print(compiler.summary())
-        
-        if compiler.compiled():
-            launcher = Launcher(options, compiler.exe_file)
-            launcher.write_report()
-            print(launcher.summary())
-            
-            check_output = CheckOutput(options, launcher.stdout, launcher.stderr)
-            check_output.write_report()
-            print(check_output.summary())
+        analyser = Analyser(options)
+        analyser.run(sys.stdout)
     except Exception as e:
         print(e, file=sys.stderr)
         exit(1)
@@ -0,0 +1,145 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+from array import array
+import os
+
+
+def parse_values(line):
+    '''
+    Split a line into its values, and pair each of them with its numerical value, or None if it is not a number
+    '''
+    values = line.split()
+    numbers = []
+    for v in values:
+        try:
+            numbers.append(float(v))
+        except ValueError:
+            numbers.append(None)
+    return values, numbers
+
+
+class Reference:
+    '''
+    The content of a reference file (e.g. the one an output should be equal_to), loaded once and pre-parsed
+    on demand so that it can be shared by all the submissions checked against it
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = Reference.file_signature(path)
+
+        with open(path, "rb") as f:
+            # the same translation carried out when files are read in text mode
+            self.text = f.read().decode(errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+
+        self.parsed = False
+
+    @staticmethod
+    def file_signature(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def is_stale(self):
+        try:
+            return Reference.file_signature(self.path) != self.signature
+        except OSError:
+            return True
+
+    def parse(self):
+        '''
+        Parse the values of each line. Everything is stored in a few flat arrays rather than in per-line objects, 
+        whose reference counts would be updated by each process that reads them, thereby making private copies 
+        of the memory pages they live in. Should be called before forking, so that the arrays are shared
+        '''
+        if self.parsed:
+            return
+        
+        # the line number, the position in the text and the index of the first value of each non-empty line
+        self._line_numbers = array("q")
+        self._line_starts = array("q")
+        self._line_ends = array("q")
+        self._first_values = array("q")
+        # the numerical value of each value and whether it is a number at all
+        self._numbers = array("d")
+        self._is_number = bytearray()
+        
+        pos = 0
+        for nl, line in enumerate(self.text.split("\n"), 1):
+            values, numbers = parse_values(line)
+            if len(values) > 0:
+                self._line_numbers.append(nl)
+                self._line_starts.append(pos)
+                self._line_ends.append(pos + len(line))
+                self._first_values.append(len(self._numbers))
+                self._numbers.extend(0.0 if n is None else n for n in numbers)
+                self._is_number.extend(n is not None for n in numbers)
+            pos += len(line) + 1
+        self._first_values.append(len(self._numbers))
+        self.parsed = True
+
+    def numbered_values(self):
+        '''
+        Yield a (line number, values, numbers) tuple for each non-empty line, where numbers contains the numerical 
+        value of each value (or None). The tuples are built on the fly from the arrays filled by parse()
+        '''
+        self.parse()
+        text, numbers, is_number = self.text, self._numbers, self._is_number
+        lines = zip(self._line_numbers, self._line_starts, self._line_ends, self._first_values, self._first_values[1:])
+        for nl, start, end, first, last in lines:
+            line_numbers = numbers[first:last].tolist()
+            if 0 in is_number[first:last]:
+                line_numbers = [n if number else None for n, number in zip(line_numbers, is_number[first:last])]
+            yield nl, text[start:end].split(), line_numbers
+
+    def open(self):
+        return ReferenceReader(self)
+
+
+class ReferenceReader:
+    '''
+    A minimal read-only file-like view of a Reference that does not copy its content
+    '''
+
+    def __init__(self, reference):
+        self.text = reference.text
+        self.pos = 0
+
+    def read(self, size):
+        chunk = self.text[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class ReferenceCache:
+    '''
+    Per-process cache of Reference objects. Entries are reloaded whenever the modification time or the size
+    of the underlying file change
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self._references = {}
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        reference = self._references.get(path)
+        if reference is None or reference.is_stale():
+            reference = Reference(path)
+            self._references[path] = reference
+        return reference
+
+    def clear(self):
+        self._references.clear()
+
+
+cache = ReferenceCache()
@@ -0,0 +1,278 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+from dataclasses import dataclass
+from typing import Optional
+import os, time, shutil, signal, resource, threading
+import subprocess as sp
+
+from profiler import profiler, rusage_to_dict
+
+# process groups of the children started by run_process that are still running
+_running = set()
+
+# prlimit (from util-linux) sets the limits and then execs the command
+_PRLIMIT = shutil.which("prlimit")
+
+# what the C and C++ runtimes (and valgrind) print when an allocation or a fork fails because of a limit
+_MEMORY_FAILURES = (b"bad_alloc", b"Cannot allocate memory", b"out of memory")
+_PROCESS_FAILURES = (b"Resource temporarily unavailable",)
+
+
+class Limits:
+    '''
+    Resource limits enforced on a child process. Each limit is disabled if set to 0
+    '''
+
+    def __init__(self, options):
+        self.timeout = options.get("timeout", 0) # wall-clock time, in seconds
+        self.cpu_time = options.get("cpu_time", 0) # in seconds
+        self.memory = options.get("memory", 0) # address space, in MB
+        self.output_size = options.get("output_size", 0) # maximum size of written files, in MB
+        self.processes = options.get("processes", 0)
+
+    def rlimits(self):
+        '''
+        The enabled limits as a list of (prlimit option, resource, soft limit, hard limit) tuples
+        '''
+        rlimits = []
+        if self.cpu_time > 0:
+            # the soft limit sends a SIGXCPU, the hard one a SIGKILL, should the former be ignored
+            rlimits.append(("--cpu", resource.RLIMIT_CPU, int(self.cpu_time), int(self.cpu_time) + 1))
+        if self.memory > 0:
+            memory = int(self.memory * 1024 * 1024)
+            rlimits.append(("--as", resource.RLIMIT_AS, memory, memory))
+        if self.output_size > 0:
+            output_size = int(self.output_size * 1024 * 1024)
+            rlimits.append(("--fsize", resource.RLIMIT_FSIZE, output_size, output_size))
+        if self.processes > 0:
+            # note that this limit is per-user and it is not enforced for root
+            rlimits.append(("--nproc", resource.RLIMIT_NPROC, self.processes, self.processes))
+        return rlimits
+
+    def wrap(self, command):
+        '''
+        Prefix command with a call to prlimit. Unlike a preexec_fn, this is safe when other threads are running
+        '''
+        rlimits = self.rlimits()
+        if len(rlimits) == 0:
+            return command
+        return [_PRLIMIT] + [f"{option}={soft}:{hard}" for option, _, soft, hard in rlimits] + ["--"] + command
+
+    def apply(self, pid):
+        '''
+        Set the limits of a running process. Used only if prlimit is not available, since the process may allocate
+        or spawn whatever it wants before the limits are set
+        '''
+        for _, limit, soft, hard in self.rlimits():
+            try:
+                resource.prlimit(pid, limit, (soft, hard))
+            except (OSError, AttributeError):
+                # the process has already exited or this is not Linux
+                pass
+
+    def exceeded(self, return_code, rusage, stderr):
+        '''
+        Returns a description of the limit that made the process with the given return code, resource usage and
+        standard error (a CapturedStream or None) fail, or None
+        '''
+        if return_code == -signal.SIGXCPU:
+            return "CPU time"
+        if return_code == -signal.SIGXFSZ:
+            return "output size"
+        if return_code == 0:
+            return None
+        # processes that ignore SIGXCPU are killed when they hit the hard limit
+        if self.cpu_time > 0 and return_code == -signal.SIGKILL and rusage.ru_utime + rusage.ru_stime >= self.cpu_time:
+            return "CPU time"
+        
+        tail = b""
+        if stderr is not None and (self.memory > 0 or self.processes > 0):
+            with open(stderr.path, "rb") as f:
+                f.seek(max(0, stderr.size - (1 << 16)))
+                tail = f.read()
+        if self.memory > 0:
+            # a failed allocation can only be told from a regular crash by what the process printed or by its 
+            # resident memory (in kB) having got close to the limit
+            close_to_limit = rusage.ru_maxrss * 1024 > 0.9 * self.memory * 1024 * 1024
+            if any(failure in tail for failure in _MEMORY_FAILURES) or (return_code < 0 and close_to_limit):
+                return "memory"
+        if self.processes > 0 and any(failure in tail for failure in _PROCESS_FAILURES):
+            return "processes"
+        return None
+
+
+@dataclass
+class CapturedStream:
+    '''
+    An output stream of a child process that has been spilled to a file, possibly truncated
+    '''
+    path: str
+    size: int = 0
+    truncated: bool = False
+
+    def open(self):
+        return open(self.path, "r", errors="replace")
+
+    def read(self):
+        with self.open() as f:
+            return f.read()
+
+
+@dataclass
+class RunResult:
+    return_code: int
+    stdout: Optional[CapturedStream]
+    stderr: Optional[CapturedStream]
+    timed_out: bool = False
+    # user and system time and maximum resident set size of the process, as returned by os.wait4
+    resources: Optional[dict] = None
+    # the limit other than the timeout that made the process fail, if any
+    exceeded: Optional[str] = None
+
+    def limit_exceeded(self) -> Optional[str]:
+        '''
+        Returns a description of the limit that made the process fail, or None
+        '''
+        if self.timed_out:
+            return "wall-clock time"
+        return self.exceeded
+
+
+def wait_process(process, command, start):
+    '''
+    Wait for process to exit, set its return code and record its resource usage, which subprocess would otherwise discard
+    '''
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    profiler.record_process(command, start, rusage)
+    return rusage
+
+
+def run_and_capture(command):
+    '''
+    Run command and return its return code and its standard output and error merged together. Meant for short-lived
+    tools (e.g. compilers) whose output can be kept in memory
+    '''
+    start = time.perf_counter()
+    process = sp.Popen(command, stdout=sp.PIPE, stderr=sp.STDOUT, text=True)
+    with process.stdout:
+        output = process.stdout.read()
+    wait_process(process, command, start)
+    return process.returncode, output
+
+
+def kill_running():
+    '''
+    Kill the process groups of all the children started by run_process that are still running. Since they live in their
+    own sessions, they would otherwise outlive the current process if this gets killed
+    '''
+    for pid in list(_running):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def _kill_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _capture(pipe, stream, max_size):
+    '''
+    Copy the content of pipe to the stream's file until max_size bytes have been written, and then keep
+    draining the pipe so that the child never blocks on a full pipe
+    '''
+    with open(stream.path, "wb") as f:
+        for chunk in iter(lambda: pipe.read(1 << 16), b""):
+            if max_size > 0 and stream.size + len(chunk) > max_size:
+                chunk = chunk[0:max_size - stream.size]
+                stream.truncated = True
+            if len(chunk) > 0:
+                f.write(chunk)
+                stream.size += len(chunk)
+    pipe.close()
+
+
+def _feed(pipe, data):
+    try:
+        pipe.write(data.encode())
+    except BrokenPipeError:
+        # the child is not interested in (the rest of) its input
+        pass
+    finally:
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+
+def run_process(command, stdin=None, limits=None, cwd=None, stdout_path=None, stderr_path=None, max_capture_size=0, env=None):
+    '''
+    Run command in its own process group with the given limits, kill the whole group once the
+    process exits or the timeout expires and return a RunResult. If given, the standard output and
+    error are streamed to stdout_path and stderr_path, respectively, up to max_capture_size bytes
+    each, and are discarded otherwise. If env is None, the child inherits the current environment
+    '''
+    timeout = limits.timeout if limits is not None and limits.timeout > 0 else None
+    stdin_pipe = sp.PIPE if stdin is not None else sp.DEVNULL
+    stdout_pipe = sp.PIPE if stdout_path is not None else sp.DEVNULL
+    stderr_pipe = sp.PIPE if stderr_path is not None else sp.DEVNULL
+
+    popen_command = command
+    if limits is not None and _PRLIMIT is not None:
+        popen_command = limits.wrap(command)
+
+    start = time.perf_counter()
+    process = sp.Popen(popen_command, stdin=stdin_pipe, stdout=stdout_pipe, stderr=stderr_pipe, cwd=cwd,
+                       env=env, start_new_session=True)
+    _running.add(process.pid)
+    if limits is not None and _PRLIMIT is None:
+        limits.apply(process.pid)
+
+    threads = []
+    streams = []
+    for pipe, path in [(process.stdout, stdout_path), (process.stderr, stderr_path)]:
+        stream = None
+        if path is not None:
+            stream = CapturedStream(path)
+            threads.append(threading.Thread(target=_capture, args=(pipe, stream, max_capture_size)))
+        streams.append(stream)
+    if stdin is not None:
+        threads.append(threading.Thread(target=_feed, args=(process.stdin, stdin)))
+    for thread in threads:
+        thread.start()
+
+    # the timeout is enforced by a timer rather than by process.wait(), so that the child can be reaped by os.wait4
+    expired = threading.Event()
+    def expire():
+        expired.set()
+        _kill_group(process)
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+
+    try:
+        rusage = wait_process(process, command, start)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        # get rid of any process left behind by the child, which may also keep the pipes open
+        _kill_group(process)
+        _running.discard(process.pid)
+        for thread in threads:
+            thread.join()
+
+    # the timer may go off right after the child has exited on its own
+    timed_out = expired.is_set() and process.returncode == -signal.SIGKILL
+    exceeded = None
+    if limits is not None and not timed_out:
+        exceeded = limits.exceeded(process.returncode, rusage, streams[1])
+    return RunResult(process.returncode, streams[0], streams[1], timed_out, rusage_to_dict(rusage), exceeded)
@@ -0,0 +1,128 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+import os, sys, shutil, tempfile, threading
+
+from runner import run_and_capture
+
+# Run the command given after the scratch folder in new user, mount, network and IPC namespaces, where every file
+# system but the scratch folder has been made read-only. The mount points are read from /proc/self/mounts, where
+# spaces are escaped: those that contain any are left alone. There is no new PID namespace, since its first process
+# ignores the signals (e.g. SIGABRT) the program may send to itself
+_UNSHARE = ["unshare", "--user", "--map-root-user", "--mount", "--net", "--ipc"]
+_SETUP = '''
+scratch="$1"
+shift
+mount --bind "$scratch" "$scratch" || exit 125
+# the working directory still refers to the folder as it was before the bind mount
+cd "$scratch" || exit 125
+# there is no point in remounting the file systems that are read-only already or that only root can write to
+for target in $(awk '$4 ~ /^rw/ && $3 !~ /^(proc|sysfs|cgroup2?|devpts|mqueue)$/ { print $2 }' /proc/self/mounts); do
+    [ "$target" = "$scratch" ] || mount -o remount,bind,ro "$target" 2>/dev/null
+done
+exec "$@"
+'''
+
+# the folders of the sandboxes that exist at the moment, which are never staged into other sandboxes
+_active = set()
+
+# whether the namespaces can be used on this machine, checked on first use
+_namespaces_supported = None
+_probe_lock = threading.Lock()
+
+
+def _wrap(folder, command):
+    return _UNSHARE + ["sh", "-c", _SETUP, "sh", folder] + command
+
+
+def namespaces_supported():
+    '''
+    Unprivileged user namespaces are often disabled, or unshare itself may be missing
+    '''
+    global _namespaces_supported
+    # the regular run and the valgrind one are started at the same time
+    with _probe_lock:
+        if _namespaces_supported is None:
+            folder = tempfile.mkdtemp(prefix="pynta_probe_")
+            try:
+                return_code, output = run_and_capture(_wrap(folder, ["true"]))
+                _namespaces_supported = return_code == 0
+                output = (output.strip().splitlines() or [f"return code {return_code}"])[0]
+            except OSError:
+                _namespaces_supported = False
+                output = "unshare not found"
+            finally:
+                shutil.rmtree(folder, ignore_errors=True)
+
+            if not _namespaces_supported:
+                print(f"NOTE: the program cannot be isolated with Linux namespaces ({output}), it will only run in a scratch folder", file=sys.stderr)
+    return _namespaces_supported
+
+
+class Sandbox:
+    '''
+    A temporary folder a program is run in and that is removed afterwards. If [sandbox] is enabled, the folder is
+    created under scratch_root (a tmpfs, by default) and, if namespaces is true, the program is cut off from the
+    network and can write only to the folder itself. Otherwise the folder is created in cwd, and the program is not
+    isolated in any way
+    '''
+
+    def __init__(self, options, prefix, cwd):
+        sandbox = options["sandbox"]
+        self.isolated = False
+        if sandbox["enable"]:
+            root = sandbox["scratch_root"]
+            # e.g. /dev/shm does not exist on macOS
+            if root == "" or not os.path.isdir(root):
+                root = None
+            self.folder = tempfile.mkdtemp(prefix=f"pynta_{prefix}", dir=root)
+            self.isolated = sandbox["namespaces"] and namespaces_supported()
+        else:
+            self.folder = tempfile.mkdtemp(prefix=prefix, dir=cwd)
+        _active.add(self.folder)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        _active.discard(self.folder)
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def path(self, path):
+        return os.path.join(self.folder, path)
+
+    def command(self, command):
+        if self.isolated:
+            return _wrap(self.folder, command)
+        return command
+
+    def stage(self, cwd, excluded):
+        '''
+        Make the content of cwd (e.g. the input files the program opens by relative path) available in the sandbox,
+        except for the given names. Files are copied, so that the program cannot modify the originals, while folders
+        are linked (and are read-only if the sandbox is isolated)
+        '''
+        for name in os.listdir(cwd):
+            path = os.path.join(cwd, name)
+            if name in excluded or path in _active:
+                continue
+            if os.path.isfile(path):
+                shutil.copy2(path, self.path(name))
+            elif os.path.isdir(path):
+                os.symlink(os.path.abspath(path), self.path(name))
+
+    def copy_back(self, names, cwd):
+        '''
+        Move the given files, if the program has written them, from the sandbox to cwd
+        '''
+        for name in names:
+            path = self.path(name)
+            # a link could be used to make us copy a file the program has no access to
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            destination = os.path.join(cwd, name)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.move(path, destination)
@@ -0,0 +1,425 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+from collections import Counter, deque, defaultdict
+from array import array
+from multiprocessing import Pool
+import sys, os, re, json, zlib, pickle
+
+from parser import _COMMENT, _DIRECTIVE, _LITERAL
+from utils import print_log_section
+from profiler import profiler
+
+# bump whenever the way fingerprints are computed changes, so that old indices are rejected
+INDEX_VERSION = 1
+# maximum number of occurrences of the same fingerprint in a file that are used to find the matching regions
+MAX_OCCURRENCES = 8
+
+# comments and directives are dropped (as in clean_source) and literals are replaced by a placeholder, but the
+# newlines are kept, so that each token can be traced back to its line
+RE_STRIP = re.compile(f'{_COMMENT}|{_DIRECTIVE}|{_LITERAL}', re.DOTALL)
+RE_TOKEN = re.compile(r'[A-Za-z_]\w*|\.?\d(?:[eEpP][+-]|[\w.])*|->|\+\+|--|<<=?|>>=?|&&|\|\||[<>=!+\-*/%&|^]=|\n|\S')
+
+C_KEYWORDS = {
+    "auto", "break", "case", "char", "const", "continue", "default", "do", "double", "else", "enum", "extern", "float",
+    "for", "goto", "if", "inline", "int", "long", "register", "restrict", "return", "short", "signed", "sizeof",
+    "static", "struct", "switch", "typedef", "union", "unsigned", "void", "volatile", "while", "bool", "NULL"
+}
+
+# the normalized version of each token seen so far (None for newlines)
+_normalized = {"\n" : None}
+# stable (i.e. not salted like hash()) identifiers of the normalized tokens
+_token_ids = {}
+
+
+def _strip_match(m):
+    token = m.group()
+    newlines = "\n" * token.count("\n")
+    if token[0] == '"' or token[0] == "'":
+        return " $" + newlines
+    return newlines
+
+
+def _normalize(token):
+    c = token[0]
+    if c.isalpha() or c == "_":
+        return token if token in C_KEYWORDS else "V"
+    if c.isdigit() or (c == "." and len(token) > 1):
+        return "N"
+    if c == "$":
+        return "S"
+    return token
+
+
+def tokenize(source):
+    '''
+    The normalized tokens of the source and the line each of them is found on. Identifiers, numbers and literals are
+    replaced by placeholders, so that renaming variables or changing constants does not hide a copy
+    '''
+    tokens = []
+    lines = []
+    line = 1
+    # the per-token work is kept to a minimum, since this is where most of the time is spent
+    for token in RE_TOKEN.findall(RE_STRIP.sub(_strip_match, source)):
+        normalized = _normalized.get(token, "")
+        if normalized is None:
+            line += 1
+            continue
+        if normalized == "":
+            normalized = _normalized[token] = _normalize(token)
+        tokens.append(normalized)
+        lines.append(line)
+    return tokens, lines
+
+
+def kgram_hashes(tokens, k):
+    '''
+    The (32-bit) hashes of all the k-grams of tokens
+    '''
+    ids = []
+    for token in tokens:
+        token_id = _token_ids.get(token)
+        if token_id is None:
+            token_id = _token_ids[token] = zlib.crc32(token.encode())
+        ids.append(token_id)
+    data = array("I", ids).tobytes()
+    # the CRC of each window of the packed identifiers is computed in C, much faster than a rolling hash in Python
+    size = 4 * k
+    return [zlib.crc32(data[i:i + size]) for i in range(0, 4 * (len(tokens) - k + 1), 4)]
+
+
+def winnow(hashes, w):
+    '''
+    The positions of the hashes selected by winnowing: the minimum of each window of w consecutive hashes (the
+    rightmost one in case of ties), each taken only once. Any match at least w + k - 1 tokens long is guaranteed to
+    share a selected hash
+    '''
+    w = min(w, len(hashes))
+    selected = []
+    # positions of the window whose hashes are in increasing order
+    window = deque()
+    last = -1
+    for i, h in enumerate(hashes):
+        while window and hashes[window[-1]] >= h:
+            window.pop()
+        window.append(i)
+        first = window[0]
+        if first <= i - w:
+            window.popleft()
+            first = window[0]
+        if first != last and i >= w - 1:
+            selected.append(first)
+            last = first
+    return selected
+
+
+class Fingerprints:
+    '''
+    The fingerprints (i.e. the winnowed k-gram hashes) of a single source file, together with the token position and the lines each of them
+    comes from. Fingerprints can be pickled and stored in an index to be compared with later submissions
+    '''
+
+    def __init__(self, name, path, source, k, w):
+        self.name = name
+        self.path = path
+        tokens, lines = tokenize(source)
+        hashes = kgram_hashes(tokens, k)
+        selected = winnow(hashes, w)
+        # arrays are much more compact than lists of tuples, and indices with thousands of files load quickly
+        self.hashes = array("I", [hashes[i] for i in selected])
+        self.positions = array("I", selected)
+        self.first_lines = array("I", [lines[i] for i in selected])
+        self.last_lines = array("I", [lines[i + k - 1] for i in selected])
+
+    def keys(self, ignored):
+        return set(self.hashes) - ignored
+
+    def occurrences(self, keys):
+        '''
+        The token position and the first and last line of each occurrence of the given hashes, grouped by hash
+        '''
+        occurrences = defaultdict(list)
+        for h, position, first_line, last_line in zip(self.hashes, self.positions, self.first_lines, self.last_lines):
+            if h in keys:
+                occurrences[h].append((position, first_line, last_line))
+        return occurrences
+
+
+def _fingerprint_file(args):
+    name, path, k, w = args
+    try:
+        with open(path, errors="replace") as f:
+            source = f.read()
+    except OSError:
+        # the analysis of the submission reports the problem, here it is just a file without fingerprints
+        source = ""
+    return Fingerprints(name, path, source, k, w)
+
+
+def minhash_signature(keys, num_hashes):
+    '''
+    A one-permutation MinHash signature: the keys are split into num_hashes bins, and the minimum of each bin is taken.
+    Empty bins borrow the value of the next non-empty one (together with their distance), which keeps the probability
+    that two signatures agree on a bin close to the Jaccard similarity of the two sets, even for small sets
+    '''
+    if len(keys) == 0:
+        return None
+    # the keys are visited in decreasing order, so that the last (i.e. the smallest) one of each bin is kept
+    minima = {key % num_hashes : key // num_hashes for key in sorted(keys, reverse=True)}
+    bins = [minima.get(b) for b in range(num_hashes)]
+
+    signature = []
+    for b in range(num_hashes):
+        distance = 0
+        while bins[(b + distance) % num_hashes] is None:
+            distance += 1
+        signature.append((bins[(b + distance) % num_hashes], distance))
+    return signature
+
+
+class Pair:
+    '''
+    Two similar files, compared through the fingerprints they share
+    '''
+
+    def __init__(self, first, second, first_keys, second_keys):
+        self.first = first
+        self.second = second
+        self.shared = first_keys & second_keys
+        shared = len(self.shared)
+        self.similarity = shared / (len(first_keys) + len(second_keys) - shared)
+        # the fraction of each file that is found in the other one
+        self.coverage = (shared / len(first_keys), shared / len(second_keys))
+        self.regions = []
+
+    def find_regions(self, k, w):
+        '''
+        Merge the shared fingerprints that come one after the other in both files into regions, each described by the
+        lines it spans in the two files and by the number of fingerprints it contains, largest first
+        '''
+        first, second = self.first.occurrences(self.shared), self.second.occurrences(self.shared)
+        # code repeated over and over (e.g. a sequence of identical statements) would produce too many matches
+        matches = sorted((a, b) for h in self.shared for a in first[h][0:MAX_OCCURRENCES] for b in second[h][0:MAX_OCCURRENCES])
+        # consecutive fingerprints are at most w tokens apart, but some of them may have been ignored
+        gap = 2 * (w + k)
+        regions = []
+        for a, b in matches:
+            extended = False
+            # the regions that may be extended by the match are the most recent ones
+            for region in reversed(regions[-MAX_OCCURRENCES:]):
+                last_a, last_b = region["last"]
+                if 0 < a[0] - last_a <= gap and 0 < b[0] - last_b <= gap:
+                    region["first_lines"][1] = max(region["first_lines"][1], a[2])
+                    region["second_lines"][1] = max(region["second_lines"][1], b[2])
+                    region["last"] = (a[0], b[0])
+                    region["fingerprints"] += 1
+                    extended = True
+                    break
+            if not extended:
+                regions.append({
+                    "first_lines" : [a[1], a[2]],
+                    "second_lines" : [b[1], b[2]],
+                    "last" : (a[0], b[0]),
+                    "fingerprints" : 1
+                })
+
+        for region in regions:
+            del region["last"]
+        # a single fingerprint shared far away from the others is most likely a coincidence
+        regions = [region for region in regions if region["fingerprints"] > 1] or regions
+        self.regions = sorted(regions, key=lambda region: -region["fingerprints"])
+
+    def to_dict(self):
+        return {
+            "first" : self.first.name,
+            "second" : self.second.name,
+            "first_path" : self.first.path,
+            "second_path" : self.second.path,
+            "similarity" : self.similarity,
+            "coverage" : list(self.coverage),
+            "regions" : self.regions
+        }
+
+
+class Similarity:
+    '''
+    Finds the pairs of similar submissions of a batch, and the pairs made of a submission and a file of the archive
+    indices (e.g. the submissions of the previous years). Each file is reduced to its fingerprints, and the
+    candidate pairs are found by Locality Sensitive Hashing of their MinHash signatures, so that only the pairs that are
+    likely to be similar are compared. Fingerprints that are shared by the starter code or by too many submissions
+    are ignored
+    '''
+
+    def __init__(self, options, submissions, processes=1):
+        self.options = options
+        similarity = options["similarity"]
+        self.k = similarity["k"]
+        self.w = similarity["winnow_window"]
+
+        with profiler.span("similarity fingerprinting", "similarity"):
+            args = [(name, path, self.k, self.w) for name, path in submissions]
+            if processes > 1 and len(args) > processes:
+                with Pool(processes) as pool:
+                    self.documents = pool.map(_fingerprint_file, args, chunksize=16)
+            else:
+                self.documents = [_fingerprint_file(arg) for arg in args]
+            base = [_fingerprint_file((path, self._path(path), self.k, self.w)) for path in similarity["base_files"]]
+
+        if similarity["index_path"] != "":
+            self.save_index(self._path(similarity["index_path"]))
+
+        self.archive = []
+        with profiler.span("similarity archive loading", "similarity"):
+            for path in similarity["archive_indices"]:
+                self.archive += self.load_index(self._path(path))
+
+        self.ignored = self._ignored(base, similarity["max_frequency"], similarity["frequency_min_submissions"])
+        self.candidates = 0
+        self.pairs = []
+        with profiler.span("similarity search", "similarity"):
+            self._find_pairs()
+
+    def _path(self, path):
+        # as all the other paths of the input file, these are relative to working_dir
+        return os.path.join(self.options["working_dir"], path)
+
+    def _ignored(self, base, max_frequency, min_submissions):
+        ignored = set()
+        for document in base:
+            ignored.update(document.hashes)
+
+        # the boilerplate any solution will have in common (e.g. the loop reading the input) is as good as starter code.
+        # In small batches, however, a handful of submissions is already a large fraction, and the fingerprints they share
+        # most likely come from copies
+        if len(self.documents) < min_submissions:
+            return ignored
+        counts = Counter()
+        for document in self.documents:
+            counts.update(set(document.hashes))
+        threshold = max(2, max_frequency * len(self.documents))
+        ignored.update(h for h, count in counts.items() if count > threshold)
+        return ignored
+
+    def save_index(self, path):
+        # only plain data is stored, so that the index does not depend on where the Fingerprints class is defined
+        data = pickle.dumps((INDEX_VERSION, self.k, self.w, [vars(document) for document in self.documents]))
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def load_index(self, path):
+        with open(path, "rb") as f:
+            version, k, w, states = pickle.load(f)
+        if version != INDEX_VERSION or k != self.k or w != self.w:
+            raise Exception(f"The similarity index '{path}' has been built with different settings (k = {k}, winnow_window = {w})")
+        
+        documents = []
+        for state in states:
+            document = Fingerprints.__new__(Fingerprints)
+            document.__dict__.update(state)
+            documents.append(document)
+        return documents
+
+    def _find_pairs(self):
+        similarity = self.options["similarity"]
+        num_hashes = similarity["num_hashes"]
+        rows = num_hashes // similarity["bands"]
+
+        documents = self.documents + self.archive
+        keys = [document.keys(self.ignored) for document in documents]
+        buckets = defaultdict(list)
+        for i in range(len(documents)):
+            signature = minhash_signature(keys[i], num_hashes)
+            if signature is None:
+                continue
+            for band in range(0, num_hashes, rows):
+                buckets[band, tuple(signature[band:band + rows])].append(i)
+
+        candidates = set()
+        N = len(self.documents)
+        for bucket in buckets.values():
+            # the submissions come first, and files of the archives are not compared among themselves
+            for n, i in enumerate(bucket):
+                if i >= N:
+                    break
+                candidates.update((i, j) for j in bucket[n + 1:])
+        self.candidates = len(candidates)
+
+        pairs = []
+        for i, j in candidates:
+            pair = Pair(documents[i], documents[j], keys[i], keys[j])
+            if pair.similarity >= similarity["min_similarity"]:
+                pairs.append(pair)
+
+        pairs.sort(key=lambda pair: (-pair.similarity, pair.first.name, pair.second.name))
+        if similarity["top_pairs"] > 0:
+            pairs = pairs[0:similarity["top_pairs"]]
+        for pair in pairs:
+            pair.find_regions(self.k, self.w)
+        self.pairs = pairs
+
+    def summary(self):
+        return f"Similar pairs: {len(self.pairs)} ({self.candidates} candidate pairs among {len(self.documents)} submissions and {len(self.archive)} archived files)"
+
+    def write_report(self):
+        similarity = self.options["similarity"]
+        with open(self._path(similarity["report_path"]), "w") as f:
+            print(self.summary(), file=f)
+            print("", file=f)
+
+            for pair in self.pairs:
+                print_log_section(f"{pair.first.name} ~ {pair.second.name}: {pair.similarity * 100:.0f}%", f)
+                print(f"{pair.first.path} ({pair.coverage[0] * 100:.0f}% of the file)", file=f)
+                print(f"{pair.second.path} ({pair.coverage[1] * 100:.0f}% of the file)", file=f)
+                print("Matching regions (lines):", file=f)
+                for region in pair.regions[0:similarity["max_regions"]]:
+                    first, second = region["first_lines"], region["second_lines"]
+                    print(f"\t{first[0]}-{first[1]} ~ {second[0]}-{second[1]}", file=f)
+                print("", file=f)
+
+    def write_json_report(self):
+        with open(self._path(self.options["similarity"]["json_report_path"]), "w") as f:
+            json.dump(self.to_dict(), f)
+
+    def to_dict(self):
+        return {
+            "submissions" : len(self.documents),
+            "archived" : len(self.archive),
+            "candidates" : self.candidates,
+            "pairs" : [pair.to_dict() for pair in self.pairs]
+        }
+
+
+if __name__ == '__main__':
+    from batch import BatchInput, find_submissions
+
+    if len(sys.argv) < 3:
+        print(f"Usage is {sys.argv[0]} input_file submission [submission ...]")
+        print("\twhere each submission can be a source file, a folder containing source files or a (quoted) glob pattern")
+        exit(1)
+
+    options = BatchInput(sys.argv[1])
+    submissions = find_submissions(sys.argv[2:])
+    if len(submissions) == 0:
+        print("No submissions found", file=sys.stderr)
+        exit(1)
+
+    processes = options["batch"]["processes"]
+    if processes <= 0:
+        processes = os.cpu_count()
+
+    options["working_dir"] = os.path.abspath(options["working_dir"])
+    os.makedirs(options["working_dir"], exist_ok=True)
+    profiling = options["profiling"]
+    profiler.enabled = profiling["enable"]
+    
+    similarity = Similarity(options, [(os.path.basename(path), path) for path in submissions], processes)
+    if options["report_format"] == "json":
+        similarity.write_json_report()
+    else:
+        similarity.write_report()
+    if profiling["enable"] and profiling["trace_file"] != "":
+        profiler.write_chrome_trace(os.path.join(options["working_dir"], profiling["trace_file"]))
+    print(similarity.summary())
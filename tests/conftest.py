@@ -0,0 +1,10 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+import os, sys
+
+# the modules of pynta import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pynta"))
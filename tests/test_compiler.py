@@ -0,0 +1,89 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+import os
+import pytest
+
+from pynta import Input
+from compiler import Compiler, compiler_version, supports_aux_info
+from parser import Parser
+
+SOURCE = '''
+double average(const double *values, int n) {
+    double sum = 0.;
+    for(int i = 0; i < n; i++) sum += values[i];
+    return sum / n;
+}
+
+int main(int argc, char *argv[]) {
+    return 0;
+}
+'''
+
+FUNCTIONS = '''
+[[parsing.functions]]
+name = "average"
+return_type = "double"
+arg_types = ["const double*", "int"]
+'''
+
+
+@pytest.mark.skipif(not supports_aux_info("gcc"), reason="gcc is required to test -aux-info")
+def test_cached_aux_info_at_another_path(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    for name in ["first", "second"]:
+        folder = tmp_path / name
+        folder.mkdir()
+        (folder / "mycode.c").write_text(SOURCE)
+        input_file = folder / "input"
+        input_file.write_text(f'filename = "{folder / "mycode.c"}"\n[parsing]\nbackend = "compiler"\n{FUNCTIONS}\n'
+                              f'[compilation]\ncache = true\ncache_dir = "{cache_dir}"\n[valgrind]\nenable = false\n')
+        monkeypatch.chdir(folder)
+        
+        options = Input(str(input_file))
+        compiler = Compiler(options)
+        assert compiler.compiled()
+        assert str(folder) in compiler.aux_info
+        parser = Parser(options, compiler)
+        assert parser.errors == [], name
+        
+    # the second compilation has been served by the cache
+    assert len(os.listdir(cache_dir)) == 1
+
+
+@pytest.mark.skipif(compiler_version("gcc") is None, reason="gcc is required to test the cache")
+def test_cached_debug_info_at_another_path(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    for name in ["first", "second"]:
+        folder = tmp_path / name
+        folder.mkdir()
+        (folder / "mycode.c").write_text(SOURCE)
+        input_file = folder / "input"
+        # valgrind makes the executable be compiled with debug info
+        input_file.write_text(f'filename = "{folder / "mycode.c"}"\n[compilation]\ncache = true\ncache_dir = "{cache_dir}"\n'
+                              f'[valgrind]\nenable = true\n')
+        monkeypatch.chdir(folder)
+        
+        compiler = Compiler(Input(str(input_file)))
+        assert compiler.compiled()
+        with open(compiler.exe_file, "rb") as f:
+            assert str(folder).encode() in f.read()
+
+
+@pytest.mark.skipif(compiler_version("gcc") is None, reason="gcc is required to test the compilation")
+@pytest.mark.parametrize("single_invocation", ["false", "true"])
+def test_single_invocation_with_werror(tmp_path, monkeypatch, single_invocation):
+    (tmp_path / "mycode.c").write_text("int main(void) {\n\tint unused;\n\treturn 0;\n}\n")
+    input_file = tmp_path / "input"
+    input_file.write_text(f'filename = "{tmp_path / "mycode.c"}"\n[compilation]\ncommand = "gcc -Werror"\n'
+                          f'all_warnings_command = "gcc -Wall -Werror"\nsingle_invocation = {single_invocation}\n'
+                          f'[valgrind]\nenable = false\n')
+    monkeypatch.chdir(tmp_path)
+    
+    compiler = Compiler(Input(str(input_file)))
+    # the unused variable is an error only for all_warnings_command
+    assert compiler.compiled()
+    assert compiler.errors == []
@@ -0,0 +1,69 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+import re
+import pytest
+
+from output import Column, Output
+
+
+def _values(max_length):
+    values = []
+    for length in range(1, max_length + 3):
+        digits = "1234567890" * (length // 10 + 1)
+        values += [digits[0:length], "+" + digits[0:length - 1], "-" + digits[0:length - 1]]
+    return [v for v in values if v not in ("+", "-")]
+
+
+def _errors(tmp_path, column, values, engine):
+    path = tmp_path / "output.dat"
+    path.write_text("\n".join(values) + "\n")
+    output = Output({"type" : "file", "name" : "output.dat", "columns" : [column], "engine" : engine}, cwd=str(tmp_path))
+    output.check()
+    return output.num_errors
+
+
+@pytest.mark.parametrize("max_length", [1, 2, 3, 10])
+def test_int_pattern_matches_only_valid_values(max_length):
+    column = Column({"datatype" : "int", "max_length" : max_length})
+    pattern = re.compile(column.pattern())
+    for v in _values(max_length):
+        if pattern.fullmatch(v):
+            assert column.check_value(v) == [], v
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+@pytest.mark.parametrize("max_length", [1, 2, 3, 10])
+def test_int_max_length_boundary(tmp_path, engine, max_length):
+    options = {"datatype" : "int", "max_length" : max_length}
+    column = Column(options)
+    values = _values(max_length)
+    expected = sum(len(column.check_value(v)) for v in values)
+    assert expected > 0
+    assert _errors(tmp_path, options, values, engine) == expected
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+def test_signed_int_one_character_too_long(tmp_path, engine):
+    options = {"datatype" : "int", "max_length" : 10}
+    assert _errors(tmp_path, options, ["-123456789", "+123456789", "1234567890"], engine) == 0
+    assert _errors(tmp_path, options, ["-1234567890"], engine) == 1
+    assert _errors(tmp_path, options, ["+1234567890"], engine) == 1
+
+
+def test_errors_are_not_capped_by_default(tmp_path):
+    options = {"datatype" : "int"}
+    values = ["x"] * 150
+    (tmp_path / "output.dat").write_text("\n".join(values) + "\n")
+    output = Output({"type" : "file", "name" : "output.dat", "columns" : [options]}, cwd=str(tmp_path))
+    output.check()
+    assert output.num_errors == 150
+    assert len(output.errors) == 150
+    
+    output = Output({"type" : "file", "name" : "output.dat", "columns" : [options], "max_errors" : 100}, cwd=str(tmp_path))
+    output.check()
+    assert output.num_errors == 150
+    assert len(output.errors) == 100
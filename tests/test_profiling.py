@@ -0,0 +1,31 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+import pytest
+
+from pynta import Input, Analyser
+from compiler import compiler_version
+from profiler import profiler
+
+
+@pytest.mark.skipif(compiler_version("gcc") is None, reason="gcc is required to run the analysis")
+def test_profiler_is_scoped_to_each_analysis(tmp_path, monkeypatch):
+    (tmp_path / "mycode.c").write_text("int main(void) {\n\treturn 0;\n}\n")
+    monkeypatch.chdir(tmp_path)
+    
+    events = []
+    for enable in ["true", "false", "true"]:
+        input_file = tmp_path / "input"
+        input_file.write_text(f'filename = "{tmp_path / "mycode.c"}"\n[valgrind]\nenable = false\n'
+                              f'[[output]]\ntype = "stdout"\n[profiling]\nenable = {enable}\ntrace_file = ""\n')
+        analyser = Analyser(Input(str(input_file)))
+        analyser.run()
+        events.append(len(analyser.events))
+        # nothing is left behind for the next analysis carried out by the same process
+        assert not profiler.enabled
+        assert profiler.events == []
+        
+    assert events[0] > 0 and events[1] == 0 and events[2] == events[0]
@@ -0,0 +1,25 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+from reference import Reference, parse_values
+
+
+def test_numbered_values_match_line_parsing(tmp_path):
+    path = tmp_path / "reference.dat"
+    path.write_bytes(b"1 2.5 abc\r\n\n   \n\t-3e2  nan x1\r4\n  last")
+    reference = Reference(str(path))
+    
+    expected = []
+    for nl, line in enumerate(reference.text.split("\n"), 1):
+        values, numbers = parse_values(line)
+        if len(values) > 0:
+            expected.append((nl, values, numbers))
+    
+    found = list(reference.numbered_values())
+    assert [(nl, values) for nl, values, _ in found] == [(nl, values) for nl, values, _ in expected]
+    # nan is a number, but it is not equal to itself
+    assert [[str(n) for n in numbers] for _, _, numbers in found] == [[str(n) for n in numbers] for _, _, numbers in expected]
+    assert found[0] == (1, ["1", "2.5", "abc"], [1.0, 2.5, None])
@@ -0,0 +1,28 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+import os
+
+from sandbox import Sandbox
+
+
+def test_stage(tmp_path):
+    (tmp_path / "data.txt").write_text("42\n")
+    (tmp_path / "output.dat").write_text("old\n")
+    (tmp_path / "inputs").mkdir()
+    (tmp_path / "inputs" / "more.txt").write_text("43\n")
+    
+    options = {"sandbox" : {"enable" : False}}
+    with Sandbox(options, "valgrind_", str(tmp_path)) as first, Sandbox(options, "run_", str(tmp_path)) as second:
+        second.stage(str(tmp_path), {"output.dat"})
+        assert sorted(os.listdir(second.folder)) == ["data.txt", "inputs"]
+        # the program can modify its copy only
+        assert not os.path.islink(second.path("data.txt"))
+        with open(second.path("data.txt"), "w") as f:
+            f.write("0\n")
+        assert (tmp_path / "data.txt").read_text() == "42\n"
+        assert os.path.islink(second.path("inputs"))
+        assert open(second.path("inputs/more.txt")).read() == "43\n"
@@ -0,0 +1,49 @@
+'''
+Created on Oct 18, 2026
+
+@author: lorenzo
+'''
+
+import copy
+
+from pynta import Input
+from similarity import Similarity
+
+SOURCE = '''
+#include <stdio.h>
+
+int main() {
+    int n, values[100];
+    double sum = 0., sum_sq = 0.;
+    if(scanf("%d", &n) != 1 || n > 100) return 1;
+    for(int i = 0; i < n; i++) {
+        if(scanf("%d", values + i) != 1) return 1;
+        sum += values[i];
+        sum_sq += values[i] * values[i];
+    }
+    double average = sum / n;
+    printf("%lf %lf\\n", average, sum_sq / n - average * average);
+    for(int i = n - 1; i >= 0; i--) {
+        if(values[i] > average) printf("%d\\n", values[i]);
+    }
+    return 0;
+}
+'''
+
+
+def test_copies_in_a_small_batch(tmp_path):
+    submissions = []
+    for name, variable in [("first", "n"), ("second", "count"), ("third", "size")]:
+        path = tmp_path / f"{name}.c"
+        path.write_text(SOURCE.replace("n,", f"{variable},").replace("< n", f"< {variable}").replace("/ n", f"/ {variable}"))
+        submissions.append((name, str(path)))
+    
+    options = copy.deepcopy(Input.defaults)
+    options["working_dir"] = str(tmp_path)
+    similarity = Similarity(options, submissions)
+    # every fingerprint is shared by all the submissions, but the batch is too small for them to be ignored
+    assert len(similarity.pairs) == 3
+    assert all(pair.similarity > 0.9 for pair in similarity.pairs)
+    
+    options["similarity"]["frequency_min_submissions"] = 3
+    assert len(Similarity(options, submissions).pairs) == 0